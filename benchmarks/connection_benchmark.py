@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# First-request latency with and without connection pre-warming, against the local
+# mock server with an emulated connection setup cost (--connect_delay stands in for
+# DNS + TCP + TLS). Also checks whether the connection survives an idle gap between
+# turns with the default httpx keep-alive and with the tuned pool settings.
+#
+# Usage: python benchmarks/connection_benchmark.py --connect_delay 0.15 --idle 6
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import start_server
+import r1
+
+def params_for(server, **overrides):
+    params = {name: info["value"] for name, info in r1.DEFAULT_PARAMS.items()}
+    params.update(api_key="mock", base_url=server.url, model="deepseek-chat", max_tokens=16)
+    params.update(overrides)
+    return params
+
+def timed_request(client, params):
+    start = time.perf_counter()
+    client.chat.completions.create(**r1.build_request(params, [{"role": "user", "content": "ping"}]))
+    return (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Connection pre-warming benchmark')
+    parser.add_argument('--connect_delay', type=float, default=0.15, help='Emulated connection setup time, seconds')
+    parser.add_argument('--think', type=float, default=1.0, help='Seconds the user spends typing before sending')
+    parser.add_argument('--idle', type=float, default=6.0,
+                        help='Idle gap between turns, seconds (httpx drops idle connections after 5 s by default)')
+    args = parser.parse_args()
+
+    server = start_server(connect_delay=args.connect_delay, answer_chars=200, code_blocks=0)
+
+    # Import openai up front so both variants measure only the network path
+    from openai import OpenAI
+
+    # Before: default client created after configuration, connection opened by the first request
+    params = params_for(server)
+    client = OpenAI(api_key=params["api_key"], base_url=params["base_url"])
+    time.sleep(args.think)
+    cold_first = timed_request(client, params)
+    time.sleep(args.idle)
+    cold_second = timed_request(client, params)
+    cold_connections = server.connections
+
+    # After: warmer started at launch, tuned keep-alive
+    server.connections = 0
+    warmer = r1.ConnectionWarmer(params).start()
+    time.sleep(args.think)
+    start = time.perf_counter()
+    client = warmer.client(params)
+    warmer.begin()
+    timed_request(client, params)
+    warmer.end()
+    warm_first = (time.perf_counter() - start) * 1000
+    time.sleep(args.idle)
+    warm_second = timed_request(client, params)
+    warm_connections = server.connections
+    warmer.stop()
+
+    print(f"Emulated connection setup: {args.connect_delay * 1000:.0f} ms, idle gap between turns: {args.idle:.0f} s")
+    print(f"{'':24}{'first request':>15}{'after idle':>15}{'connections':>13}")
+    print(f"{'default client':24}{cold_first:>12.1f} ms{cold_second:>12.1f} ms{cold_connections:>13}")
+    print(f"{'pre-warmed, tuned pool':24}{warm_first:>12.1f} ms{warm_second:>12.1f} ms{warm_connections:>13}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# End-to-end benchmark of the CLI's own overhead against the local mock server.
+# Drives r1.py the way a user does (one-shot runs, a scripted chat session and a
+# batch run) and measures:
+#   - startup: import time of r1 and wall time of a complete one-shot run
+#   - per-turn client overhead: session wall time minus the time the server spent
+#     answering, per turn, for streamed and non-streamed responses
+#   - render time: display_response on the mock answer, and what the session's
+#     metrics recorded per turn
+#   - memory growth: messages size and traced allocations per turn of a long
+#     in-process conversation kept in a SessionStore, as main() does
+#   - batch throughput: requests and completion tokens per second
+# Results are written as JSON for regression tracking.
+#
+# Usage: python benchmarks/e2e_benchmark.py --turns 20 --output results.json
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCHMARKS, "..")
+sys.path.insert(0, BENCHMARKS)
+sys.path.insert(0, ROOT)
+
+from rich.console import Console
+
+from mock_server import start_server
+from startup_benchmark import measure_import
+import r1
+
+def run_r1(server, *args, stdin=None):
+    command = [sys.executable, "r1.py", "--api_key", "mock", "--base_url", server.url, *args]
+    start = time.perf_counter()
+    subprocess.run(command, cwd=ROOT, input=stdin, capture_output=True, text=True, check=True,
+                   env=dict(os.environ, COLUMNS="100"))
+    return time.perf_counter() - start
+
+def server_seconds(server, since):
+    with server.lock:
+        return sum(server.durations[since:])
+
+def bench_startup(server, runs):
+    measure_import()
+    import_ms = [measure_import()[0] for _ in range(runs)]
+    one_shot_ms = [run_r1(server, "--one-shot", "ping", "--model", "deepseek-chat") * 1000 for _ in range(runs)]
+
+    return {
+        "import_ms": round(statistics.median(import_ms), 1),
+        "one_shot_ms": round(statistics.median(one_shot_ms), 1),
+    }
+
+# A scripted chat session; overhead is what the client adds on top of the server's own time
+def bench_session(server, turns, stream, directory):
+    metrics_file = os.path.join(directory, f"session-{'stream' if stream else 'fetch'}.jsonl")
+    script = "".join(f"Question {i}: explain it again\n" for i in range(turns)) + "exit\n"
+    args = ["--no-interactive", "--journal_dir", os.path.join(directory, "journal"), "--metrics_file", metrics_file]
+    if not stream:
+        args.append("--no-stream")
+
+    # Startup and shutdown of the same process without any turns
+    baseline = run_r1(server, *args, stdin="exit\n")
+
+    since = len(server.durations)
+    wall = run_r1(server, *args, stdin=script)
+    served = server_seconds(server, since)
+
+    with open(metrics_file, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+
+    render_ms = sorted(record["render_seconds"] * 1000 for record in records)
+    return {
+        "turns": turns,
+        "wall_seconds": round(wall, 3),
+        "server_seconds": round(served, 3),
+        "overhead_ms_per_turn": round((wall - baseline - served) / turns * 1000, 2),
+        "render_ms_p50": round(r1.percentile(render_ms, 0.5), 2),
+        "render_ms_p99": round(r1.percentile(render_ms, 0.99), 2),
+    }
+
+def bench_render(options, repeat):
+    from mock_server import make_answer, make_reasoning
+
+    answer = make_answer(options["answer_chars"], options["code_blocks"])
+    reasoning = make_reasoning(options["reasoning_chars"])
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        r1.display_turn(reasoning, answer)
+        best = min(best, time.perf_counter() - start)
+
+    return {"answer_chars": len(answer), "code_blocks": options["code_blocks"], "display_turn_ms": round(best * 1000, 2)}
+
+# Grow a conversation in-process, the way main() does, and trace what it allocates
+def bench_memory(server, turns, directory):
+    params = {name: info["value"] for name, info in r1.DEFAULT_PARAMS.items()}
+    params.update(api_key="mock", base_url=server.url)
+    client = r1.create_client(params)
+    policy = r1.RequestPolicy(params)
+    messages = r1.SessionStore(directory, "memory")
+    messages.append({"role": "system", "content": params["system_message"]})
+
+    # The first turn pays for imports and connection setup
+    r1.request_turn(client, params, [messages[0], {"role": "user", "content": "warm up"}], policy)
+
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Question {i}: explain it again"})
+        context = r1.fit_context(messages, params["context_budget"])[0]
+        reasoning, answer, _ = r1.request_turn(client, params, context, policy)
+        messages.append({"role": "assistant", "content": answer}, reasoning)
+    traced_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    messages_bytes = sum(len(json.dumps(message).encode("utf-8")) for message in messages)
+    messages.close()
+    return {
+        "turns": turns,
+        "messages_bytes": messages_bytes,
+        "messages_bytes_per_turn": round(messages_bytes / turns),
+        "traced_bytes_per_turn": round((traced_bytes - start_bytes) / turns),
+        "peak_traced_bytes": peak_bytes,
+    }
+
+def bench_batch(server, prompts, concurrency, directory):
+    input_path = os.path.join(directory, "batch.jsonl")
+    output_path = os.path.join(directory, "batch-results.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        for i in range(prompts):
+            f.write(json.dumps({"id": str(i), "prompt": f"Prompt {i}"}) + "\n")
+
+    wall = run_r1(server, "--batch", input_path, "--output", output_path, "--concurrency", str(concurrency),
+                  "--model", "deepseek-chat")
+
+    with open(output_path, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f]
+    completion_tokens = sum((result.get("usage") or {}).get("completion_tokens", 0) for result in results)
+
+    return {
+        "prompts": prompts,
+        "concurrency": concurrency,
+        "completed": sum(1 for result in results if not result.get("error")),
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(results) / wall, 2),
+        "completion_tokens_per_second": round(completion_tokens / wall, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark against the mock DeepSeek server')
+    parser.add_argument('--turns', type=int, default=20, help='Turns in the scripted chat session')
+    parser.add_argument('--memory_turns', type=int, default=200, help='Turns in the in-process memory run')
+    parser.add_argument('--runs', type=int, default=5, help='Runs of each startup measurement, the median is reported')
+    parser.add_argument('--batch_prompts', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.05, help='Mock server latency before the first byte')
+    parser.add_argument('--token_rate', type=float, default=0.0, help='Mock completion tokens per second (0 for unlimited)')
+    parser.add_argument('--reasoning_chars', type=int, default=2000)
+    parser.add_argument('--answer_chars', type=int, default=4000)
+    parser.add_argument('--code_blocks', type=int, default=4)
+    parser.add_argument('--output', type=str, help='Write the JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    options = {
+        "latency": args.latency, "token_rate": args.token_rate, "reasoning_chars": args.reasoning_chars,
+        "answer_chars": args.answer_chars, "code_blocks": args.code_blocks,
+    }
+    server = start_server(**options)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": options,
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        print("startup...", file=sys.stderr)
+        results["startup"] = bench_startup(server, args.runs)
+        print("scripted sessions...", file=sys.stderr)
+        results["session_stream"] = bench_session(server, args.turns, True, directory)
+        results["session_no_stream"] = bench_session(server, args.turns, False, directory)
+
+        # In-process measurements render to a null device, so neither terminal speed
+        # nor accumulated output skews the timings and memory numbers
+        r1.console = Console(file=open(os.devnull, "w"), width=100, force_terminal=True)
+        print("render and memory...", file=sys.stderr)
+        results["render"] = bench_render(options, args.runs)
+        results["memory"] = bench_memory(server, args.memory_turns, directory)
+        print("batch...", file=sys.stderr)
+        results["batch"] = bench_batch(server, args.batch_prompts, args.concurrency, directory)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Benchmark for the 'history' command on a long conversation: the original viewer,
+# which re-rendered every message on each visit, against the paged viewer with its
+# render cache (first visit to a page, and revisiting it).
+#
+# Usage: python benchmarks/history_benchmark.py --turns 500
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rich.console import Console
+from rich.panel import Panel
+from rich.table import Table
+
+import r1
+
+# The original viewer body, kept here as the baseline (without the screen clear and prompt)
+def legacy_display_history(messages):
+    for i, msg in enumerate(messages):
+        if msg["role"] == "system":
+            continue
+        if msg["role"] == "user":
+            r1.console.print(Panel(
+                msg["content"],
+                title=f"[bold cyan]User (Message {i})[/bold cyan]",
+                border_style="cyan",
+                padding=(1, 2)
+            ))
+        else:
+            r1.display_response(msg["content"], f"[bold green]Assistant (Response {i})[/bold green]", "green")
+
+# A conversation of `turns` question/answer pairs; answers mix prose and code
+def make_conversation(turns):
+    answer = (
+        "Here is how to do it, with **markdown** and a list:\n\n- first\n- second\n\n"
+        "```python\ndef f(x):\n    return x * 2\n```\n\nAnd a short explanation afterwards.\n"
+    )
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Question {i}: how do I double a number?"})
+        messages.append({"role": "assistant", "content": answer})
+    return messages
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='History viewer benchmark')
+    parser.add_argument('--turns', type=int, default=500, help='Question/answer pairs in the conversation')
+    args = parser.parse_args()
+
+    # Render into memory so terminal speed does not skew the numbers
+    r1.console = Console(file=io.StringIO(), width=100, force_terminal=True)
+
+    messages = make_conversation(args.turns)
+    turns = r1.history_turns(messages)
+    last_page = (len(turns) - 1) // r1.HISTORY_PAGE_SIZE
+    cache = r1.RenderCache()
+
+    full = timed(legacy_display_history, messages)
+    first = timed(r1.render_history_page, messages, turns, last_page, cache)
+    revisit = timed(r1.render_history_page, messages, turns, last_page, cache)
+
+    # Page back through the whole conversation, then forward again
+    start = time.perf_counter()
+    for page in range(last_page, -1, -1):
+        r1.render_history_page(messages, turns, page, cache)
+    walk_cold = time.perf_counter() - start
+    start = time.perf_counter()
+    for page in range(last_page + 1):
+        r1.render_history_page(messages, turns, page, cache)
+    walk_warm = time.perf_counter() - start
+
+    table = Table(title=f"history ({args.turns} turns, {r1.HISTORY_PAGE_SIZE} turns per page)")
+    table.add_column("Measurement")
+    table.add_column("Time", justify="right")
+    table.add_row("Legacy: render whole history", f"{full * 1000:.1f} ms")
+    table.add_row("Paged: first visit to last page", f"{first * 1000:.1f} ms")
+    table.add_row("Paged: revisit (cached)", f"{revisit * 1000:.1f} ms")
+    table.add_row(f"Paged: walk all {last_page + 1} pages, cold", f"{walk_cold * 1000:.1f} ms")
+    table.add_row(f"Paged: walk all {last_page + 1} pages, cached", f"{walk_warm * 1000:.1f} ms")
+
+    Console().print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# Local stand-in for the DeepSeek API, for benchmarks that should not hit the real
+# service. Serves /chat/completions (streaming and non-streaming) with configurable
+# server latency, token rate, reasoning size and code-block density, and can delay
+# every new connection to emulate TCP + TLS setup. Tail latency and errors can be
+# injected deterministically (every Nth request) to exercise retries and hedging,
+# and streams can stall after their first batch to exercise the total deadline.
+# Prompt prefixes are cached like DeepSeek's context cache (whole messages, in
+# 64-token units), so prompt_cache_hit_tokens reflects how stable the prefix is.
+# The server records how long it spent on each completion request, so benchmarks
+# can subtract it from what the client measured to get the client's own overhead.
+#
+# Usage: python benchmarks/mock_server.py --port 8765 --latency 0.2 --token_rate 200
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_OPTIONS = {
+    "latency": 0.0,
+    "connect_delay": 0.0,
+    "token_rate": 0.0,
+    "reasoning_chars": 2000,
+    "answer_chars": 2000,
+    "code_blocks": 2,
+    "model_latency": {},
+    "slow_every": 0,
+    "slow_latency": 0.0,
+    "error_every": 0,
+    "error_status": 503,
+    "stall": 0.0,
+}
+
+# Characters per emulated token, roughly what DeepSeek's tokenizer gives for English
+CHARS_PER_TOKEN = 4
+
+# DeepSeek's context cache stores prefixes in units of this many tokens
+CACHE_UNIT_TOKENS = 64
+
+PROSE = "The quick brown fox jumps over the lazy dog while explaining *streams*. "
+CODE = "for i in range(10):\n    total += i * i\n"
+
+# Build an answer of about `chars` characters containing `code_blocks` fenced blocks
+def make_answer(chars, code_blocks):
+    parts = []
+    per_part = max(chars // (code_blocks * 2 + 1), 1)
+
+    for i in range(code_blocks):
+        parts.append((PROSE * (per_part // len(PROSE) + 1))[:per_part] + "\n\n")
+        parts.append("```python\n" + (CODE * (per_part // len(CODE) + 1))[:per_part].rstrip() + "\n```\n\n")
+    parts.append((PROSE * (per_part // len(PROSE) + 1))[:per_part])
+
+    return "".join(parts)
+
+def make_reasoning(chars):
+    return (PROSE * (chars // len(PROSE) + 1))[:chars]
+
+# Cache the message prefixes of a request; returns the characters of the longest
+# prefix that was already cached by an earlier request
+def cached_prefix_chars(prefix_cache, model, messages):
+    digest = hashlib.sha256(model.encode("utf-8"))
+    cached_chars = chars = 0
+
+    for message in messages:
+        digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+        chars += len(message.get("content") or "")
+        key = digest.hexdigest()
+        if key in prefix_cache:
+            cached_chars = chars
+        prefix_cache.add(key)
+
+    return cached_chars
+
+def usage_for(prompt_chars, reasoning, answer, cached_chars=0):
+    reasoning_tokens = len(reasoning) // CHARS_PER_TOKEN
+    completion_tokens = reasoning_tokens + len(answer) // CHARS_PER_TOKEN
+    prompt_tokens = prompt_chars // CHARS_PER_TOKEN
+    hit_tokens = cached_chars // CHARS_PER_TOKEN // CACHE_UNIT_TOKENS * CACHE_UNIT_TOKENS
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_cache_hit_tokens": hit_tokens,
+        "prompt_cache_miss_tokens": prompt_tokens - hit_tokens,
+        "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+    }
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Runs once per connection, so a delay here emulates connection setup
+    def setup(self):
+        super().setup()
+        delay = self.server.options["connect_delay"]
+        if delay:
+            time.sleep(delay)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "deepseek-reasoner", "object": "model", "owned_by": "mock"},
+                {"id": "deepseek-chat", "object": "model", "owned_by": "mock"},
+            ]})
+        else:
+            self._send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        try:
+            self._complete()
+        finally:
+            with self.server.lock:
+                self.server.durations.append(time.perf_counter() - started)
+
+    def _complete(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        options = self.server.options
+        with self.server.lock:
+            self.server.requests += 1
+            number = self.server.requests
+
+        if options["error_every"] and number % options["error_every"] == 0:
+            self._send_json(options["error_status"], {"error": {"message": "injected error", "type": "server_error"}})
+            return
+
+        reasoning = make_reasoning(options["reasoning_chars"]) if "reasoner" in body.get("model", "") else ""
+        answer = make_answer(options["answer_chars"], options["code_blocks"])
+        prompt_chars = sum(len(message.get("content") or "") for message in body.get("messages", []))
+        with self.server.lock:
+            cached_chars = cached_prefix_chars(self.server.prefix_cache, body.get("model", ""), body.get("messages", []))
+        usage = usage_for(prompt_chars, reasoning, answer, cached_chars)
+
+        # Server-side "thinking" before the first byte
+        latency = options["model_latency"].get(body.get("model"), options["latency"])
+        if options["slow_every"] and number % options["slow_every"] == 0:
+            latency = options["slow_latency"]
+        if latency:
+            time.sleep(latency)
+
+        if body.get("stream"):
+            self._stream(body, reasoning, answer, usage)
+            return
+
+        if options["token_rate"]:
+            time.sleep(usage["completion_tokens"] / options["token_rate"])
+
+        message = {"role": "assistant", "content": answer}
+        if reasoning:
+            message["reasoning_content"] = reasoning
+        self._send_json(200, {
+            "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def _stream(self, body, reasoning, answer, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # Emit tokens in 10 ms batches so high token rates are still accurate
+        token_rate = self.server.options["token_rate"]
+        tokens_per_batch = max(int(token_rate / 100), 1) if token_rate else 64
+        step = tokens_per_batch * CHARS_PER_TOKEN
+        started = time.perf_counter()
+        sent_tokens = 0
+
+        def event(delta=None, finish_reason=None, with_usage=False):
+            chunk = {
+                "id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if with_usage:
+                chunk["usage"] = usage
+            self._write_chunk(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+
+        try:
+            for field, text in (("reasoning_content", reasoning), ("content", answer)):
+                for i in range(0, len(text), step):
+                    event({field: text[i:i + step]})
+                    self.wfile.flush()
+                    if self.server.options["stall"] and not sent_tokens:
+                        time.sleep(self.server.options["stall"])
+                    sent_tokens += tokens_per_batch
+                    if token_rate:
+                        # Sleep until this batch is due, without accumulating drift
+                        delay = started + sent_tokens / token_rate - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+
+            event({}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                event(with_usage=True)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the request
+            pass
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, MockHandler)
+        self.options = dict(DEFAULT_OPTIONS, **options)
+        self.connections = 0
+        self.requests = 0
+        self.prefix_cache = set()
+        self.durations = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+# Start a mock server on a background thread; port 0 picks a free port
+def start_server(port=0, **options):
+    server = MockServer(("127.0.0.1", port), options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock OpenAI-compatible DeepSeek server')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=DEFAULT_OPTIONS["latency"],
+                        help='Seconds before the first byte of each response')
+    parser.add_argument('--connect_delay', type=float, default=DEFAULT_OPTIONS["connect_delay"],
+                        help='Seconds added to every new connection, emulating TCP + TLS setup')
+    parser.add_argument('--token_rate', type=float, default=DEFAULT_OPTIONS["token_rate"],
+                        help='Completion tokens per second (0 for as fast as possible)')
+    parser.add_argument('--reasoning_chars', type=int, default=DEFAULT_OPTIONS["reasoning_chars"],
+                        help='Size of reasoning_content for reasoner models')
+    parser.add_argument('--answer_chars', type=int, default=DEFAULT_OPTIONS["answer_chars"],
+                        help='Size of the answer')
+    parser.add_argument('--code_blocks', type=int, default=DEFAULT_OPTIONS["code_blocks"],
+                        help='Number of fenced code blocks in the answer')
+    parser.add_argument('--model_latency', type=str, nargs='*', default=[], metavar='MODEL=SECONDS',
+                        help='Per-model latency overriding --latency, e.g. deepseek-reasoner=30')
+    parser.add_argument('--slow_every', type=int, default=0,
+                        help='Make every Nth request take --slow_latency instead (tail latency)')
+    parser.add_argument('--slow_latency', type=float, default=0.0)
+    parser.add_argument('--error_every', type=int, default=0,
+                        help='Fail every Nth request with --error_status')
+    parser.add_argument('--error_status', type=int, default=503)
+    parser.add_argument('--stall', type=float, default=DEFAULT_OPTIONS["stall"],
+                        help='Seconds every stream pauses after its first batch')
+    args = parser.parse_args()
+
+    options = vars(args).copy()
+    port = options.pop("port")
+    options["model_latency"] = {
+        model: float(seconds) for model, seconds in (item.split("=", 1) for item in args.model_latency)
+    }
+    server = MockServer(("127.0.0.1", port), options)
+    print(f"Mock DeepSeek API listening on {server.url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Micro-benchmark for display_response: the single-pass fence tokenizer in r1.py
+# against the original regex + placeholder implementation it replaced.
+#
+# Usage: python benchmarks/render_benchmark.py --size_kb 400 --blocks 40
+
+import argparse
+import io
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rich.console import Console
+from rich.syntax import Syntax
+from rich.table import Table
+
+import r1
+
+# The original implementation, kept here as the baseline
+def legacy_extract_code_blocks(content):
+    code_block_pattern = r"```(\w*)\n(.*?)```"
+    return re.findall(code_block_pattern, content, re.DOTALL)
+
+def legacy_split(content):
+    code_blocks = legacy_extract_code_blocks(content)
+    placeholder_pattern = "__CODE_BLOCK_{}_PLACEHOLDER__"
+    processed_content = content
+
+    for i, (language, code) in enumerate(code_blocks):
+        placeholder = placeholder_pattern.format(i)
+        block_pattern = f"```{language}\n{code}```"
+        processed_content = processed_content.replace(block_pattern, placeholder)
+
+    return code_blocks, processed_content.split("__CODE_BLOCK_")
+
+def legacy_display_response(content, title, style="green"):
+    code_blocks, parts = legacy_split(content)
+    if not code_blocks:
+        r1.display_markdown(content, title, style)
+        return
+
+    if parts[0]:
+        r1.display_markdown(parts[0])
+    for part in parts[1:]:
+        if "_PLACEHOLDER__" in part:
+            index_str, remaining = part.split("_PLACEHOLDER__", 1)
+            language, code = code_blocks[int(index_str)]
+            r1.console.print(Syntax(code.strip(), language or "text", theme="monokai", line_numbers=True))
+            if remaining:
+                r1.display_markdown(remaining)
+
+def tokenize(content):
+    tokenizer = r1.FenceTokenizer()
+    return tokenizer.feed(content) + tokenizer.close()
+
+# Feed the response in small chunks, the way it arrives while streaming
+def tokenize_streamed(content, chunk_size=32):
+    tokenizer = r1.FenceTokenizer()
+    segments = []
+    for i in range(0, len(content), chunk_size):
+        segments.extend(tokenizer.feed(content[i:i + chunk_size]))
+    return segments + tokenizer.close()
+
+# Build a response of roughly size_kb kilobytes with the given number of code blocks
+def make_response(size_kb, blocks):
+    paragraph = "The quick brown fox jumps over the lazy dog, *again* and **again**.\n"
+    code = "def f(x):\n    return x * 2  # doubled\n"
+    block_size = max(size_kb * 1024 // max(blocks, 1), len(paragraph))
+    parts = []
+
+    for i in range(blocks):
+        parts.append(paragraph * (block_size // 2 // len(paragraph)))
+        parts.append(f"```python\n# block {i}\n" + code * (block_size // 2 // len(code)) + "```\n")
+    parts.append("Done.\n")
+
+    return "".join(parts)
+
+def best_of(repeat, func, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='display_response render benchmark')
+    parser.add_argument('--size_kb', type=int, nargs='+', default=[100, 400, 800],
+                        help='Response sizes to benchmark, in kilobytes')
+    parser.add_argument('--blocks', type=int, default=40, help='Number of code blocks per response')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, best is reported')
+    args = parser.parse_args()
+
+    # Render into memory so terminal speed does not skew the numbers
+    r1.console = Console(file=io.StringIO(), width=100, force_terminal=True)
+
+    table = Table(title=f"display_response ({args.blocks} code blocks)")
+    table.add_column("Size")
+    table.add_column("Split: legacy", justify="right")
+    table.add_column("Split: tokenizer", justify="right")
+    table.add_column("Split: streamed", justify="right")
+    table.add_column("Render: legacy", justify="right")
+    table.add_column("Render: tokenizer", justify="right")
+
+    for size_kb in args.size_kb:
+        content = make_response(size_kb, args.blocks)
+        table.add_row(
+            f"{len(content) // 1024} KB",
+            f"{best_of(args.repeat, legacy_split, content) * 1000:.1f} ms",
+            f"{best_of(args.repeat, tokenize, content) * 1000:.1f} ms",
+            f"{best_of(args.repeat, tokenize_streamed, content) * 1000:.1f} ms",
+            f"{best_of(args.repeat, legacy_display_response, content, 'Bench') * 1000:.1f} ms",
+            f"{best_of(args.repeat, r1.display_response, content, 'Bench') * 1000:.1f} ms",
+        )
+
+    Console().print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Cold-start benchmark for r1.py. Measures the cumulative import time of the r1
+# module with `python -X importtime` and the wall time of a full `r1.py --help`
+# run, and fails when the import time exceeds the budget.
+#
+# Usage: python benchmarks/startup_benchmark.py --runs 10 --max_import_ms 250
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Run `import r1` under -X importtime; returns r1's cumulative time in ms and per-module self times
+def measure_import():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import r1"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+    total_ms = None
+    self_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = [field.strip() for field in line[len("import time:"):].split("|")]
+        if not fields[0].isdigit():
+            # Header line
+            continue
+        module = fields[2].strip()
+        self_times[module] = int(fields[0]) / 1000
+        if module == "r1":
+            total_ms = int(fields[1]) / 1000
+
+    return total_ms, self_times
+
+# Wall time of a complete process that parses arguments and exits
+def measure_help():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "r1.py", "--help"], cwd=ROOT, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='r1.py startup benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='Number of runs, the median is reported')
+    parser.add_argument('--max_import_ms', type=float, default=250.0,
+                        help='Fail when the median import time of r1 exceeds this')
+    parser.add_argument('--top', type=int, default=8, help='Number of slowest modules to list')
+    args = parser.parse_args()
+
+    # Warm the filesystem and bytecode caches so the runs are comparable
+    measure_import()
+
+    import_times = []
+    help_times = []
+    self_times = {}
+    for _ in range(args.runs):
+        total_ms, self_times = measure_import()
+        import_times.append(total_ms)
+        help_times.append(measure_help())
+
+    import_ms = statistics.median(import_times)
+    print(f"import r1:      {import_ms:.1f} ms (median of {args.runs}, budget {args.max_import_ms:.0f} ms)")
+    print(f"r1.py --help:   {statistics.median(help_times):.1f} ms (median wall time)")
+    print("slowest modules (self time):")
+    for module, ms in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {ms:7.1f} ms  {module}")
+
+    # Heavy modules that must stay out of the startup path
+    for module in ("openai", "rich.markdown", "rich.syntax", "asyncio"):
+        if module in self_times:
+            print(f"FAIL: {module} is imported at startup")
+            return 1
+
+    if import_ms > args.max_import_ms:
+        print(f"FAIL: import time {import_ms:.1f} ms exceeds the {args.max_import_ms:.0f} ms budget")
+        return 1
+
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
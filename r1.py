@@ -1,22 +1,42 @@
 #!/usr/bin/env python3
 # Please install dependencies first: `pip install openai rich python-dotenv`
 
-from openai import OpenAI
+# Startup time matters for one-shot use, so the slow imports (openai, asyncio and
+# Rich's Markdown/Syntax/Live/Progress renderers) are done inside the functions
+# that first need them. benchmarks/startup_benchmark.py guards the import budget.
 import argparse
+import bisect
+import gzip
+import hashlib
+import importlib
+import importlib.util
+import io
+import itertools
+import json
+import math
 import os
+import queue
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
 from typing import Dict, Any
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Rich library imports for enhanced UI
-from rich.console import Console
+from rich.console import Console, Group
 from rich.panel import Panel
-from rich.markdown import Markdown
-from rich.syntax import Syntax
 from rich.prompt import Prompt, Confirm
 from rich.table import Table
+from rich.text import Text
+from rich.markup import escape
 
 # Initialize Rich console
 console = Console()
@@ -78,9 +98,186 @@ DEFAULT_PARAMS = {
         "value": "You are a helpful assistant, focused on the field of AI and machine learning, sort of like my personal programming tutor.",
         "help": "System message that defines the assistant's behavior and knowledge",
         "type": str
+    },
+    "max_connections": {
+        "value": 10,
+        "help": "Size of the HTTP connection pool to the API",
+        "type": int,
+        "min": 1,
+        "max": 100
+    },
+    "keepalive_expiry": {
+        "value": 300.0,
+        "help": "Seconds an idle connection is kept open for reuse by the next request",
+        "type": float,
+        "min": 0.0,
+        "max": 3600.0
+    },
+    "http2": {
+        "value": False,
+        "help": "Use HTTP/2 for API requests (requires the h2 package)",
+        "type": bool
+    },
+    "connect_timeout": {
+        "value": 10.0,
+        "help": "Seconds to wait for a connection to the API to be established",
+        "type": float,
+        "min": 1.0,
+        "max": 120.0
+    },
+    "read_timeout": {
+        "value": 600.0,
+        "help": "Seconds to wait for data from the API before giving up",
+        "type": float,
+        "min": 1.0,
+        "max": 3600.0
+    },
+    "first_token_timeout": {
+        "value": 60.0,
+        "help": "Seconds to wait for the first token before retrying or falling back",
+        "type": float,
+        "min": 1.0,
+        "max": 600.0
+    },
+    "total_timeout": {
+        "value": 600.0,
+        "help": "Deadline in seconds for a complete response before falling back",
+        "type": float,
+        "min": 1.0,
+        "max": 3600.0
+    },
+    "retries": {
+        "value": 2,
+        "help": "Automatic retries for rate limits, server errors and dropped connections",
+        "type": int,
+        "min": 0,
+        "max": 10
+    },
+    "hedge": {
+        "value": False,
+        "help": "Send a second identical request if the first is slower than usual to start, and use whichever answers first",
+        "type": bool
+    },
+    "hedge_delay": {
+        "value": 10.0,
+        "help": "Seconds before a hedged request is sent, until there is enough history to use the p95 time to first token",
+        "type": float,
+        "min": 0.1,
+        "max": 600.0
+    },
+    "fallback_model": {
+        "value": "",
+        "help": "Model to retry with when the main model misses a deadline (e.g. deepseek-chat); empty to disable",
+        "type": str
+    },
+    "context_budget": {
+        "value": 56000,
+        "help": "Maximum estimated tokens of conversation history sent per request; oldest turns are dropped first",
+        "type": int,
+        "min": 1000,
+        "max": 128000
+    },
+    "stable_prefix": {
+        "value": False,
+        "help": "Keep the sent prompt prefix byte-stable across turns so DeepSeek's context cache can serve it: system message changes are appended as new instructions and old turns are only trimmed at coarse checkpoints",
+        "type": bool
     }
 }
 
+# Command line flags that control the CLI rather than the API call
+UI_FLAGS = [
+    "no_interactive", "no_stream", "cache", "cache_dir", "cache_size_mb", "cache_ttl_hours",
+    "batch", "output", "concurrency", "rpm", "tpm", "batch_order", "max_retries", "journal_dir",
+    "search", "index_reasoning", "one_shot", "metrics_file", "metrics_port", "compare",
+    "daemon", "socket", "no_daemon", "session", "hot_messages", "profile", "profiles_file", "base_params"
+]
+
+# Builds the converter for one parameter: coerces a value (typed, or a string as
+# entered at a prompt) to the parameter's type and clamps it to its range. Raises
+# ValueError for values that cannot be converted.
+def compile_param(name, info):
+    kind = info["type"]
+    low, high = info.get("min"), info.get("max")
+
+    def convert(value):
+        if kind == bool:
+            if isinstance(value, str) and value.strip().lower() in ("true", "yes", "y", "on", "1"):
+                return True
+            if isinstance(value, str) and value.strip().lower() in ("false", "no", "n", "off", "0"):
+                return False
+            if isinstance(value, bool):
+                return value
+            raise ValueError(f"{name} must be true or false, got {value!r}")
+
+        if kind == str:
+            if not isinstance(value, str):
+                raise ValueError(f"{name} must be a string, got {value!r}")
+            return value
+
+        try:
+            if isinstance(value, bool) or (kind == int and isinstance(value, float) and not value.is_integer()):
+                raise ValueError
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be {'an integer' if kind == int else 'a number'}, got {value!r}") from None
+
+        # Constrain to min/max if specified
+        if low is not None and value < low:
+            value = low
+        if high is not None and value > high:
+            value = high
+        return value
+
+    return convert
+
+# One converter per parameter, shared by the configuration screens and profiles
+PARAM_SCHEMA = {name: compile_param(name, info) for name, info in DEFAULT_PARAMS.items()}
+
+# Validate a dict of parameter values against PARAM_SCHEMA; returns the converted
+# values. Errors name the source, e.g. the profile the values came from.
+def validate_params(values, source):
+    if not isinstance(values, dict):
+        raise ValueError(f"{source}: expected an object of parameter values")
+
+    validated = {}
+    for name, value in values.items():
+        if name not in PARAM_SCHEMA:
+            raise ValueError(f"{source}: unknown parameter '{name}'")
+        try:
+            validated[name] = PARAM_SCHEMA[name](value)
+        except ValueError as e:
+            raise ValueError(f"{source}: {e}") from None
+
+    return validated
+
+# Parameters that take effect when a connection is opened rather than per request
+CONNECTION_PARAMS = ("api_key", "base_url", "max_connections", "keepalive_expiry", "http2", "connect_timeout", "read_timeout")
+
+# Named parameter sets, following the temperature recommendations above
+BUILTIN_PROFILES = {
+    "coding": {"temperature": 0.0},
+    "math": {"temperature": 0.0},
+    "data": {"temperature": 1.0},
+    "general": {"temperature": 1.3},
+    "translation": {"temperature": 1.3},
+    "creative": {"temperature": 1.5},
+}
+
+# Built-in profiles plus those in the profiles file, a JSON object mapping profile
+# names to parameter values; file profiles replace built-in ones of the same name.
+# Every profile is validated here, so applying one later cannot fail.
+def load_profiles(path):
+    profiles = dict(BUILTIN_PROFILES)
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected an object mapping profile names to parameters")
+        for name, values in data.items():
+            profiles[name] = validate_params(values, f"{path}: profile '{name}'")
+
+    return profiles
+
 # Setup argument parser for customization
 def setup_args():
     parser = argparse.ArgumentParser(description='DeepSeek Reasoner CLI')
@@ -106,12 +303,176 @@ def setup_args():
                         help=DEFAULT_PARAMS["model"]["help"])
     parser.add_argument('--system_message', type=str, default=DEFAULT_PARAMS["system_message"]["value"],
                         help=DEFAULT_PARAMS["system_message"]["help"])
+    parser.add_argument('--max_connections', type=int, default=DEFAULT_PARAMS["max_connections"]["value"],
+                        help=DEFAULT_PARAMS["max_connections"]["help"])
+    parser.add_argument('--keepalive_expiry', type=float, default=DEFAULT_PARAMS["keepalive_expiry"]["value"],
+                        help=DEFAULT_PARAMS["keepalive_expiry"]["help"])
+    parser.add_argument('--http2', action=argparse.BooleanOptionalAction, default=DEFAULT_PARAMS["http2"]["value"],
+                        help=DEFAULT_PARAMS["http2"]["help"])
+    parser.add_argument('--connect_timeout', type=float, default=DEFAULT_PARAMS["connect_timeout"]["value"],
+                        help=DEFAULT_PARAMS["connect_timeout"]["help"])
+    parser.add_argument('--read_timeout', type=float, default=DEFAULT_PARAMS["read_timeout"]["value"],
+                        help=DEFAULT_PARAMS["read_timeout"]["help"])
+    parser.add_argument('--first_token_timeout', type=float, default=DEFAULT_PARAMS["first_token_timeout"]["value"],
+                        help=DEFAULT_PARAMS["first_token_timeout"]["help"])
+    parser.add_argument('--total_timeout', type=float, default=DEFAULT_PARAMS["total_timeout"]["value"],
+                        help=DEFAULT_PARAMS["total_timeout"]["help"])
+    parser.add_argument('--retries', type=int, default=DEFAULT_PARAMS["retries"]["value"],
+                        help=DEFAULT_PARAMS["retries"]["help"])
+    parser.add_argument('--hedge', action=argparse.BooleanOptionalAction, default=DEFAULT_PARAMS["hedge"]["value"],
+                        help=DEFAULT_PARAMS["hedge"]["help"])
+    parser.add_argument('--hedge_delay', type=float, default=DEFAULT_PARAMS["hedge_delay"]["value"],
+                        help=DEFAULT_PARAMS["hedge_delay"]["help"])
+    parser.add_argument('--fallback_model', type=str, default=DEFAULT_PARAMS["fallback_model"]["value"],
+                        help=DEFAULT_PARAMS["fallback_model"]["help"])
+    parser.add_argument('--context_budget', type=int, default=DEFAULT_PARAMS["context_budget"]["value"],
+                        help=DEFAULT_PARAMS["context_budget"]["help"])
+    parser.add_argument('--stable_prefix', action=argparse.BooleanOptionalAction,
+                        default=DEFAULT_PARAMS["stable_prefix"]["value"],
+                        help=DEFAULT_PARAMS["stable_prefix"]["help"])
     
     # UI flag
     parser.add_argument('--no-interactive', action='store_true',
                         help='Disable interactive parameter configuration')
+    parser.add_argument('--no-stream', action='store_true',
+                        help='Wait for the full response instead of streaming it as it arrives')
+    parser.add_argument('--one-shot', type=str, metavar='PROMPT',
+                        help='Answer a single prompt and exit, skipping interactive configuration')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Run a background daemon that answers --one-shot prompts with a warm client')
+    parser.add_argument('--socket', type=str, default=default_socket_path(),
+                        help='Unix socket of the daemon')
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='Answer --one-shot prompts in this process even if a daemon is running')
+    parser.add_argument('--session', type=str, metavar='NAME',
+                        help='With the daemon, continue the conversation of earlier --one-shot prompts of this session')
+    parser.add_argument('--profile', type=str, metavar='NAME',
+                        help='Start with the parameters of a named profile (built in: ' + ', '.join(BUILTIN_PROFILES) +
+                             '), skipping interactive configuration. Flags given explicitly override the profile')
+    parser.add_argument('--profiles_file', type=str, default=os.path.expanduser("~/.config/deepseek-cli/profiles.json"),
+                        help='JSON file of profiles: {"name": {"parameter": value, ...}, ...}')
+    parser.add_argument('--compare', type=str, nargs='+', metavar='VARIANT',
+                        help='Variants for comparing answers side by side: a model, parameter overrides or both, '
+                             'e.g. deepseek-chat temperature=1.2 deepseek-reasoner:temperature=0.2,top_p=0.9. '
+                             'With --one-shot the prompt is compared and the CLI exits; otherwise they are the '
+                             'defaults of the compare command')
+
+    # Response cache
+    parser.add_argument('--cache', action='store_true',
+                        help='Reuse stored responses for identical requests instead of calling the API')
+    parser.add_argument('--cache_dir', type=str, default=os.path.expanduser("~/.cache/deepseek-cli/responses"),
+                        help='Directory for cached responses')
+    parser.add_argument('--cache_size_mb', type=float, default=100.0,
+                        help='Maximum size of the response cache; least recently used entries are evicted')
+    parser.add_argument('--cache_ttl_hours', type=float, default=168.0,
+                        help='Cached responses older than this are ignored and removed')
+
+    # Telemetry
+    parser.add_argument('--metrics_file', type=str,
+                        help='Append per-request performance metrics to this JSONL file')
+    parser.add_argument('--metrics_port', type=int,
+                        help='Serve metrics in Prometheus text format on http://127.0.0.1:PORT/metrics')
+
+    # Conversation storage
+    parser.add_argument('--journal_dir', type=str, default=os.path.expanduser("~/.local/share/deepseek-cli/conversations"),
+                        help='Directory for the local conversation journals that save/load upload to S3')
+    parser.add_argument('--search', type=str, metavar='QUERY',
+                        help='Search saved conversations and exit')
+    parser.add_argument('--index_reasoning', action='store_true',
+                        help='Also make the chain of thought searchable')
+    parser.add_argument('--hot_messages', type=int, default=200,
+                        help='Messages kept in memory; older ones and their reasoning are spilled to disk')
+
+    # Batch mode
+    parser.add_argument('--batch', type=str, metavar='INPUT_JSONL',
+                        help='Run the prompts in a JSONL file non-interactively ({"id": ..., "prompt": ...} or "messages" per line)')
+    parser.add_argument('--output', type=str, metavar='OUTPUT_JSONL',
+                        help='Where batch results are written; IDs already present are skipped on rerun')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Number of batch requests in flight at once')
+    parser.add_argument('--rpm', type=int, default=0,
+                        help='Batch requests per minute limit (0 for unlimited)')
+    parser.add_argument('--tpm', type=int, default=0,
+                        help='Batch tokens per minute limit (0 for unlimited)')
+    parser.add_argument('--batch_order', choices=['input', 'completed'], default='input',
+                        help='Write batch results in input order or as they complete')
+    parser.add_argument('--max_retries', type=int, default=5,
+                        help='Retries for rate limited (429) or server error (5xx) batch requests')
+
+    args = parser.parse_args()
+    if args.batch and not args.output:
+        parser.error("--batch requires --output")
+
+    # The parameters without any profile, which 'profile' switches start from
+    base_params = args.base_params = {name: getattr(args, name) for name in DEFAULT_PARAMS}
+
+    # The profiles file is only read when a profile is asked for. The profile's
+    # values become the defaults, so flags given explicitly still take precedence.
+    if args.profile:
+        try:
+            profiles = load_profiles(args.profiles_file)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if args.profile not in profiles:
+            parser.error(f"unknown profile '{args.profile}' (available: {', '.join(profiles)})")
+        parser.set_defaults(**profiles[args.profile])
+        args = parser.parse_args()
+        args.base_params = base_params
+        args.no_interactive = True
+
+    return args
+
+# Ask for a new value of one parameter, after showing its description, recommendations
+# and range; the answer is converted and clamped by PARAM_SCHEMA
+def prompt_param(param_name, current_value):
+    param_info = DEFAULT_PARAMS[param_name]
+
+    # Show parameter details
+    console.print(f"\n[bold]{param_name}[/bold]")
+    console.print(f"Description: {param_info['help']}")
     
-    return parser.parse_args()
+    if "recommendations" in param_info:
+        console.print(f"Recommendations: {param_info['recommendations']}")
+        
+    if "min" in param_info and "max" in param_info:
+        console.print(f"Range: {param_info['min']} to {param_info['max']}")
+
+    if param_info["type"] == bool:
+        return Confirm.ask(f"Enable {param_name}?", default=bool(current_value))
+
+    while True:
+        answer = Prompt.ask(f"Enter new value for {param_name}", default=str(current_value))
+        try:
+            return PARAM_SCHEMA[param_name](answer)
+        except ValueError as e:
+            console.print(f"[bold red]Error:[/bold red] {str(e)}")
+
+# Let the user pick parameters to modify until they are done; updates params in place
+def edit_params_menu(params):
+    param_names = [name for name in params if name in DEFAULT_PARAMS]
+
+    while True:
+        # Ask which parameter to edit
+        console.print("[bold]Which parameter would you like to modify?[/bold]")
+        for i, name in enumerate(param_names):
+            console.print(f"[cyan]{i+1}.[/cyan] {name} [green]({params[name]})[/green]")
+        console.print(f"[cyan]{len(param_names)+1}.[/cyan] Done editing")
+        
+        choice = Prompt.ask(
+            "Enter your choice",
+            choices=[str(i+1) for i in range(len(param_names)+1)],
+            default=str(len(param_names)+1)
+        )
+        
+        if int(choice) == len(param_names)+1:
+            break
+            
+        param_name = param_names[int(choice)-1]
+        new_value = prompt_param(param_name, params[param_name])
+            
+        # Update parameter
+        params[param_name] = new_value
+        console.print(f"[green]Updated {param_name} to {new_value}[/green]\n")
 
 # Display and configure parameters interactively
 def interactive_config(args) -> Dict[str, Any]:
@@ -124,9 +485,10 @@ def interactive_config(args) -> Dict[str, Any]:
     # Convert args to dictionary
     params = vars(args).copy()
     
-    # Remove the no-interactive flag
-    if "no_interactive" in params:
-        del params["no_interactive"]
+    # Remove the UI flags, they are not editable parameters
+    for flag in UI_FLAGS:
+        if flag in params:
+            del params[flag]
     
     # Display current parameters in a table
     table = Table(title="Current Parameters")
@@ -146,75 +508,7 @@ def interactive_config(args) -> Dict[str, Any]:
     console.print()
     
     if Confirm.ask("Would you like to modify any parameters?"):
-        while True:
-            # Create a list of parameter names
-            param_names = list(params.keys())
-            
-            # Ask which parameter to edit
-            console.print("[bold]Which parameter would you like to modify?[/bold]")
-            for i, name in enumerate(param_names):
-                console.print(f"[cyan]{i+1}.[/cyan] {name} [green]({params[name]})[/green]")
-            console.print(f"[cyan]{len(param_names)+1}.[/cyan] Done editing")
-            
-            choice = Prompt.ask(
-                "Enter your choice",
-                choices=[str(i+1) for i in range(len(param_names)+1)],
-                default=str(len(param_names)+1)
-            )
-            
-            if int(choice) == len(param_names)+1:
-                break
-                
-            param_name = param_names[int(choice)-1]
-            param_info = DEFAULT_PARAMS[param_name]
-            
-            # Get current value
-            current_value = params[param_name]
-            
-            # Show parameter details
-            console.print(f"\n[bold]{param_name}[/bold]")
-            console.print(f"Description: {param_info['help']}")
-            
-            if "recommendations" in param_info:
-                console.print(f"Recommendations: {param_info['recommendations']}")
-                
-            if "min" in param_info and "max" in param_info:
-                console.print(f"Range: {param_info['min']} to {param_info['max']}")
-            
-            # Get new value
-            if param_info["type"] == float:
-                new_value = float(Prompt.ask(
-                    f"Enter new value for {param_name}",
-                    default=str(current_value)
-                ))
-                
-                # Constrain to min/max if specified
-                if "min" in param_info and new_value < param_info["min"]:
-                    new_value = param_info["min"]
-                if "max" in param_info and new_value > param_info["max"]:
-                    new_value = param_info["max"]
-                    
-            elif param_info["type"] == int:
-                new_value = int(Prompt.ask(
-                    f"Enter new value for {param_name}",
-                    default=str(current_value)
-                ))
-                
-                # Constrain to min/max if specified
-                if "min" in param_info and new_value < param_info["min"]:
-                    new_value = param_info["min"]
-                if "max" in param_info and new_value > param_info["max"]:
-                    new_value = param_info["max"]
-                    
-            else:  # String
-                new_value = Prompt.ask(
-                    f"Enter new value for {param_name}",
-                    default=str(current_value)
-                )
-                
-            # Update parameter
-            params[param_name] = new_value
-            console.print(f"[green]Updated {param_name} to {new_value}[/green]\n")
+        edit_params_menu(params)
             
     console.clear()
     console.print(Panel.fit(
@@ -235,70 +529,203 @@ def interactive_config(args) -> Dict[str, Any]:
     
     return params
 
-# Helper function to display markdown content with code highlighting
-def display_markdown(content, title=None, style="green"):
+# Markdown content, in a titled panel if a title is given
+def markdown_renderable(content, title=None, style="green"):
+    from rich.markdown import Markdown
+
     # Create a panel with the markdown content
     md = Markdown(content)
     
     if title:
-        console.print(Panel(md, title=title, border_style=style))
-    else:
-        console.print(md)
+        return Panel(md, title=title, border_style=style)
+    return md
 
-# Helper function to detect and parse code blocks in markdown
-def extract_code_blocks(content):
-    import re
-    
-    # Find all code blocks in the markdown
-    # They follow the pattern: ```language\ncode\n```
-    code_block_pattern = r"```(\w*)\n(.*?)```"
-    code_blocks = re.findall(code_block_pattern, content, re.DOTALL)
-    
-    return code_blocks
+# Helper function to display markdown content with code highlighting
+def display_markdown(content, title=None, style="green"):
+    console.print(markdown_renderable(content, title, style))
+
+# Matches a fence line: ``` or ~~~ (three or more) with an optional info string.
+# A trailing \r is not part of the info string, so CRLF text fences the same way.
+FENCE_PATTERN = re.compile(r"^[ \t]*(`{3,}|~{3,})[ \t]*([^\n]*?)[ \t\r]*$", re.MULTILINE)
+
+# Single-pass tokenizer that splits markdown into prose and fenced code segments.
+# Text can be fed in arbitrary chunks; a segment is emitted as soon as it is complete,
+# and whatever is still open (including an unterminated fence) is flushed by close().
+# Segments are tuples of (kind, language, text) where kind is "markdown" or "code".
+class FenceTokenizer:
+    def __init__(self):
+        # Pieces of the incomplete last line, joined once the line is complete, so a
+        # long line streamed in small chunks is not recopied on every chunk
+        self._partial = []
+        self._parts = []
+        self._fence = None
+        self._language = None
+
+    # Whether the tokenizer is currently inside a fenced code block
+    @property
+    def in_code(self):
+        return self._fence is not None
+
+    def feed(self, chunk):
+        segments = []
+
+        # Only complete lines are scanned, the rest waits for the next chunk
+        cut = chunk.rfind("\n") + 1
+        if not cut:
+            if chunk:
+                self._partial.append(chunk)
+            return segments
+
+        self._partial.append(chunk[:cut])
+        data = "".join(self._partial)
+        self._partial = [chunk[cut:]] if cut < len(chunk) else []
+        self._scan(data, segments)
+
+        return segments
+
+    # The incomplete last line
+    def _partial_line(self):
+        if len(self._partial) > 1:
+            self._partial = ["".join(self._partial)]
+        return self._partial[0] if self._partial else ""
+
+    def close(self):
+        segments = []
+        if self._partial:
+            self._scan(self._partial_line() + "\n", segments)
+            self._partial = []
+
+        self._flush(segments)
+        self._fence = None
+        self._language = None
+        return segments
+
+    # The segment currently being built, including any incomplete last line
+    def pending(self, max_lines=None):
+        tail = [self._partial_line()]
+        newlines = 0
+
+        # Walk back only as far as needed to fill max_lines
+        for part in reversed(self._parts):
+            tail.append(part)
+            newlines += part.count("\n")
+            if max_lines is not None and newlines > max_lines:
+                break
+
+        text = "".join(reversed(tail)).rstrip("\n")
+        if max_lines is not None:
+            text = "\n".join(text.split("\n")[-max_lines:])
 
-# Helper function to display a response with proper formatting
+        kind = "code" if self.in_code else "markdown"
+        return kind, self._language, text
+
+    def _scan(self, text, segments):
+        position = 0
+
+        for match in FENCE_PATTERN.finditer(text):
+            fence, info = match.groups()
+
+            if self._fence is None:
+                # Opening fence, the first word of the info string is the language
+                self._parts.append(text[position:match.start()])
+                self._flush(segments)
+                self._fence = fence
+                self._language = (info.split() or [""])[0]
+            elif fence[0] == self._fence[0] and len(fence) >= len(self._fence) and not info:
+                # Closing fence: same character, at least as long, nothing after it
+                self._parts.append(text[position:match.start()])
+                self._flush(segments)
+                self._fence = None
+                self._language = None
+            else:
+                continue
+
+            # Skip the fence line and its newline
+            position = match.end() + 1
+
+        self._parts.append(text[position:])
+
+    def _flush(self, segments):
+        text = "".join(self._parts)
+        self._parts = []
+        if text.endswith("\n"):
+            text = text[:-1]
+
+        if self._fence is not None:
+            segments.append(("code", self._language, text))
+        elif text.strip():
+            segments.append(("markdown", None, text))
+
+# Turn a tokenizer segment into a Rich renderable
+def render_segment(segment):
+    from rich.markdown import Markdown
+    from rich.syntax import Syntax
+
+    kind, language, text = segment
+
+    if kind == "code":
+        # If language is empty, default to "text"
+        return Syntax(text.strip(), language or "text", theme="monokai", line_numbers=True)
+
+    return Markdown(text)
+
+# Incrementally prints a response as it is fed, one completed segment at a time.
+# A response without any code blocks is shown as a single titled panel, so the
+# first markdown segment is only printed once it is known that a fence follows it.
+class ResponseRenderer:
+    def __init__(self, title, style="green"):
+        self.title = title
+        self.style = style
+        self.tokenizer = FenceTokenizer()
+        self.printed = 0
+        self.render_seconds = 0.0
+
+    def feed(self, chunk):
+        for segment in self.tokenizer.feed(chunk):
+            self._print(segment)
+
+    def close(self):
+        segments = self.tokenizer.close()
+
+        if not self.printed and len(segments) == 1 and segments[0][0] == "markdown":
+            start = time.perf_counter()
+            display_markdown(segments[0][2], self.title, self.style)
+            self.render_seconds += time.perf_counter() - start
+            self.printed += 1
+            return
+
+        for segment in segments:
+            self._print(segment)
+
+    # Renderable for the tail of the segment that is still arriving
+    def pending_renderable(self, max_lines):
+        kind, language, text = self.tokenizer.pending(max_lines)
+        if kind == "code":
+            return render_segment((kind, language, text))
+
+        return Text(text)
+
+    def _print(self, segment):
+        start = time.perf_counter()
+        console.print(render_segment(segment))
+        self.render_seconds += time.perf_counter() - start
+        self.printed += 1
+
+# Renderables for a complete response, laid out the same way display_response prints it
+def response_renderables(content, title, style="green"):
+    tokenizer = FenceTokenizer()
+    segments = tokenizer.feed(content) + tokenizer.close()
+
+    if len(segments) == 1 and segments[0][0] == "markdown":
+        return [markdown_renderable(segments[0][2], title, style)]
+    return [render_segment(segment) for segment in segments]
+
+# Helper function to display a response with proper formatting; returns the render time
 def display_response(content, title, style="green"):
-    # Check if the content contains code blocks
-    code_blocks = extract_code_blocks(content)
-    
-    # If there are code blocks, display them with syntax highlighting
-    if code_blocks:
-        # Replace code blocks with placeholders for processing
-        placeholder_pattern = "__CODE_BLOCK_{}_PLACEHOLDER__"
-        processed_content = content
-        
-        for i, (language, code) in enumerate(code_blocks):
-            placeholder = placeholder_pattern.format(i)
-            block_pattern = f"```{language}\n{code}```"
-            processed_content = processed_content.replace(block_pattern, placeholder)
-        
-        # Split by placeholders
-        parts = processed_content.split("__CODE_BLOCK_")
-        
-        # Display the first part (if any)
-        if parts[0]:
-            display_markdown(parts[0])
-        
-        # Process and display each part with its code block
-        for i, part in enumerate(parts[1:], 0):
-            if "_PLACEHOLDER__" in part:
-                index_str, remaining = part.split("_PLACEHOLDER__", 1)
-                index = int(index_str)
-                language, code = code_blocks[index]
-                
-                # If language is empty, default to "text"
-                if not language:
-                    language = "text"
-                
-                # Display the code block with syntax highlighting
-                console.print(Syntax(code.strip(), language, theme="monokai", line_numbers=True))
-                
-                # Display remaining text if any
-                if remaining:
-                    display_markdown(remaining)
-    else:
-        # If no code blocks, just display as markdown
-        display_markdown(content, title, style)
+    renderer = ResponseRenderer(title, style)
+    renderer.feed(content)
+    renderer.close()
+    return renderer.render_seconds
 
 # Function to handle the conversation parameters configuration
 def edit_parameters(params):
@@ -318,194 +745,2808 @@ def edit_parameters(params):
     
     # Ask which parameter to edit
     if Confirm.ask("Would you like to modify any parameters for this message?"):
-        param_names = [name for name in updated_params.keys() if name in DEFAULT_PARAMS]
-        
-        while True:
-            console.print("[bold]Which parameter would you like to modify?[/bold]")
-            for i, name in enumerate(param_names):
-                console.print(f"[cyan]{i+1}.[/cyan] {name} [green]({updated_params[name]})[/green]")
-            console.print(f"[cyan]{len(param_names)+1}.[/cyan] Done editing")
-            
-            choice = Prompt.ask(
-                "Enter your choice",
-                choices=[str(i+1) for i in range(len(param_names)+1)],
-                default=str(len(param_names)+1)
-            )
-            
-            if int(choice) == len(param_names)+1:
-                break
-                
-            param_name = param_names[int(choice)-1]
-            param_info = DEFAULT_PARAMS[param_name]
-            
-            # Get current value
-            current_value = updated_params[param_name]
-            
-            # Show parameter details
-            console.print(f"\n[bold]{param_name}[/bold]")
-            console.print(f"Description: {param_info['help']}")
-            
-            if "recommendations" in param_info:
-                console.print(f"Recommendations: {param_info['recommendations']}")
-                
-            if "min" in param_info and "max" in param_info:
-                console.print(f"Range: {param_info['min']} to {param_info['max']}")
-            
-            # Get new value based on type
-            if param_info["type"] == float:
-                new_value = float(Prompt.ask(
-                    f"Enter new value for {param_name}",
-                    default=str(current_value)
-                ))
-                
-                # Constrain to min/max if specified
-                if "min" in param_info and new_value < param_info["min"]:
-                    new_value = param_info["min"]
-                if "max" in param_info and new_value > param_info["max"]:
-                    new_value = param_info["max"]
-                    
-            elif param_info["type"] == int:
-                new_value = int(Prompt.ask(
-                    f"Enter new value for {param_name}",
-                    default=str(current_value)
-                ))
-                
-                # Constrain to min/max if specified
-                if "min" in param_info and new_value < param_info["min"]:
-                    new_value = param_info["min"]
-                if "max" in param_info and new_value > param_info["max"]:
-                    new_value = param_info["max"]
-                    
-            else:  # String
-                new_value = Prompt.ask(
-                    f"Enter new value for {param_name}",
-                    default=str(current_value)
-                )
-                
-            # Update parameter
-            updated_params[param_name] = new_value
-            console.print(f"[green]Updated {param_name} to {new_value}[/green]\n")
+        edit_params_menu(updated_params)
     
     return updated_params
 
-# Helper function to display the conversation history
-def display_history(messages):
-    console.clear()
-    console.print(Panel.fit(
-        "[bold blue]DeepSeek Reasoner CLI[/bold blue] - [yellow]Conversation History[/yellow]",
-        border_style="blue"
-    ))
-    
-    # Skip the system message
-    for i, message in enumerate(messages):
-        if message["role"] == "system":
-            continue
-            
-        if message["role"] == "user":
-            console.print(Panel(
-                message["content"],
-                title=f"[bold cyan]User (Message {i})[/bold cyan]",
-                border_style="cyan",
-                padding=(1, 2)
-            ))
-        else:  # assistant
-            display_response(
-                message["content"],
-                f"[bold green]Assistant (Response {i})[/bold green]",
-                "green"
-            )
-    
-    console.print("\n[bold]Press Enter to return to the conversation[/bold]")
-    Prompt.ask("")  # Wait for user to press Enter
+# Number of turns (a user message and the replies to it) per history page
+HISTORY_PAGE_SIZE = 5
 
-# Main function
-def main():
-    args = setup_args()
-    
-    # Run interactive configuration if not disabled
-    if not args.no_interactive:
-        params = interactive_config(args)
-    else:
-        params = vars(args)
-    
-    # Initialize OpenAI client with API key
-    client = OpenAI(api_key=params["api_key"], base_url=params["base_url"])
-    
-    # Initialize the conversation with the system message
-    messages = [
-        {"role": "system", "content": params["system_message"]}
+# Rendered history messages, memoized as Rich segments keyed by message index,
+# content hash and terminal width, so revisiting a page replays the cached
+# output instead of re-parsing Markdown and re-highlighting code.
+class RenderCache:
+    def __init__(self, max_entries=200):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, index, message, width, reasoning=None):
+        content_hash = hashlib.sha1((message["content"] + (reasoning or "")).encode("utf-8")).hexdigest()
+        key = (index, message["role"], content_hash, width, reasoning is not None)
+
+        segments = self.entries.get(key)
+        if segments is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return segments
+
+        self.misses += 1
+        options = console.options.update_width(width)
+        segments = []
+        for renderable in history_renderables(index, message, reasoning):
+            segments.extend(console.render(renderable, options))
+
+        self.entries[key] = segments
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        return segments
+
+# Renderables for one message in the history view, with the reasoning behind an answer if given
+def history_renderables(index, message, reasoning=None):
+    if message["role"] == "system":
+        return [Panel(
+            message["content"],
+            title=f"[bold magenta]System (Message {index})[/bold magenta]",
+            border_style="magenta",
+            padding=(1, 2)
+        )]
+    if message["role"] == "user":
+        return [Panel(
+            message["content"],
+            title=f"[bold cyan]User (Message {index})[/bold cyan]",
+            border_style="cyan",
+            padding=(1, 2)
+        )]
+
+    renderables = []
+    if reasoning:
+        renderables = response_renderables(
+            reasoning, f"[bold magenta]Chain of Thought (Response {index})[/bold magenta]", "magenta"
+        )
+    return renderables + response_renderables(
+        message["content"],
+        f"[bold green]Assistant (Response {index})[/bold green]",
+        "green"
+    )
+
+# Start index of every turn, skipping the system message
+def history_turns(messages):
+    roles, _ = message_index(messages)
+    return [
+        i for i, role in enumerate(roles)
+        if role != "system" and (role == "user" or i == 0 or roles[i - 1] == "system")
     ]
-    
-    # Display welcome message and instructions
-    console.print(Panel.fit(
-        f"[bold blue]DeepSeek Reasoner CLI[/bold blue] - [yellow]Model: {params['model']}[/yellow]",
-        subtitle="Type 'exit' to end the conversation, 'params' to edit parameters, 'system' to edit system message, 'history' to view conversation",
-        border_style="blue"
-    ))
-    
-    # Main conversation loop
+
+# Print one page of history; only the messages on the page are rendered (and,
+# for a SessionStore, loaded from disk)
+def render_history_page(messages, turns, page, render_cache, show_reasoning=False):
+    from rich.segment import Segments
+
+    first = page * HISTORY_PAGE_SIZE
+    start = turns[first]
+    end = turns[first + HISTORY_PAGE_SIZE] if first + HISTORY_PAGE_SIZE < len(turns) else len(messages)
+
+    for i in range(start, end):
+        message = messages[i]
+        reasoning = None
+        if show_reasoning and message["role"] == "assistant" and isinstance(messages, SessionStore):
+            reasoning = messages.reasoning(i) or ""
+        console.print(Segments(render_cache.render(i, message, console.width, reasoning)))
+
+# Helper function to display the conversation history, one page at a time
+def display_history(messages, render_cache=None):
+    render_cache = render_cache or RenderCache()
+    turns = history_turns(messages)
+    pages = max((len(turns) + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE, 1)
+
+    # Start at the most recent turns
+    page = pages - 1
+    show_reasoning = False
+
     while True:
-        # Display parameter edit prompt and message input in different colors
-        console.print("\n[bold cyan]Enter your message[/bold cyan] ([italic]Type 'params' to edit parameters, 'system' to edit system message, 'history' to view conversation, or 'exit' to quit[/italic]):")
-        user_input = Prompt.ask("")
-        
-        # Check for special commands
-        if user_input.lower() == 'exit':
-            console.print("[yellow]Conversation ended.[/yellow]")
+        console.clear()
+        console.print(Panel.fit(
+            f"[bold blue]DeepSeek Reasoner CLI[/bold blue] - [yellow]Conversation History[/yellow] "
+            f"[dim](page {page + 1} of {pages})[/dim]",
+            border_style="blue"
+        ))
+
+        if not turns:
+            console.print("[yellow]No messages yet.[/yellow]")
+        else:
+            render_history_page(messages, turns, page, render_cache, show_reasoning)
+
+        console.print(
+            "\n[bold]Enter[/bold] to return, [bold]n[/bold]/[bold]p[/bold] for the next/previous page, "
+            "[bold]f[/bold]/[bold]l[/bold] for the first/last page, [bold]r[/bold] to show or hide reasoning, "
+            "or a message number to jump to it"
+        )
+        choice = Prompt.ask("").strip().lower()
+
+        if not choice:
             break
-        elif user_input.lower() == 'params':
-            params = edit_parameters(params)
-            continue
-        elif user_input.lower() == 'system':
-            current_system = messages[0]["content"]
-            console.print(f"\n[bold magenta]Current system message:[/bold magenta]\n{current_system}")
-            new_system = Prompt.ask("\n[bold magenta]Enter new system message[/bold magenta]", default=current_system)
-            messages[0]["content"] = new_system
-            params["system_message"] = new_system
-            console.print("[green]System message updated successfully![/green]")
-            continue
-        elif user_input.lower() == 'history':
-            display_history(messages)
-            continue
-        
-        # Add user message to conversation history
-        messages.append({"role": "user", "content": user_input})
-        
-        # Show "thinking" status
-        with console.status("[bold green]Thinking...[/bold green]", spinner="dots"):
-            try:
-                # Send the conversation to the API with customized parameters
-                response = client.chat.completions.create(
-                    model=params["model"],
-                    messages=messages,
-                    temperature=params["temperature"],
-                    max_tokens=params["max_tokens"],
-                    top_p=params["top_p"],
-                    frequency_penalty=params["frequency_penalty"],
-                    presence_penalty=params["presence_penalty"],
-                    stream=False
-                )
-                
-                # Extract the reasoning content and final answer
-                # Handle case where reasoning_content might not be present in the response
-                reasoning_content = getattr(response.choices[0].message, 'reasoning_content', 'No reasoning provided')
-                final_answer = response.choices[0].message.content
-                
-                # Display chain of thought reasoning
-                console.print("\n[bold magenta]Chain of Thought:[/bold magenta]")
-                display_response(reasoning_content, "Chain of Thought", "magenta")
-                
-                # Display final answer
-                console.print("\n[bold green]Final Answer:[/bold green]")
-                display_response(final_answer, "Final Answer", "green")
-                
-                # Add ONLY the final answer to the conversation history (not the reasoning_content)
-                messages.append({"role": "assistant", "content": final_answer})
-                
-            except Exception as e:
-                console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
-                # Remove the last user message since we couldn't get a response
-                messages.pop()
+        elif choice == "n":
+            page = min(page + 1, pages - 1)
+        elif choice == "p":
+            page = max(page - 1, 0)
+        elif choice == "f":
+            page = 0
+        elif choice == "l":
+            page = pages - 1
+        elif choice == "r":
+            show_reasoning = not show_reasoning
+        elif choice.isdigit() and turns:
+            # The page holding the turn that contains this message
+            index = min(int(choice), len(messages) - 1)
+            turn = max(bisect.bisect_right(turns, index) - 1, 0)
+            page = turn // HISTORY_PAGE_SIZE
+
+# Tokens of role and separator framing added to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Estimate the token count of a text locally. DeepSeek documents roughly 0.3 tokens
+# per English character and 0.6 per Chinese character; multi-byte UTF-8 characters
+# are counted as the latter. Not memoized, as a cache would keep every text it saw
+# alive; SessionStore keeps the count of each message instead.
+def estimate_tokens(text):
+    wide_chars = (len(text.encode("utf-8")) - len(text)) // 2
+    return int((len(text) - wide_chars) * 0.3 + wide_chars * 0.6) + 1
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+# Roles and token counts of all messages. A SessionStore keeps these in memory,
+# so context selection never has to load spilled messages it does not send.
+def message_index(messages):
+    if isinstance(messages, SessionStore):
+        return messages.roles, messages.tokens
+    return [message["role"] for message in messages], [message_tokens(message) for message in messages]
+
+# Conversation messages with bounded memory use. Recent messages stay in memory;
+# once there are more than hot_messages, the older half is spilled, together with
+# the reasoning of each answer, to a compressed segment file and read back on
+# demand through a small LRU cache. An offset index maps each spilled message to
+# its record, and roles and token counts stay in memory for context selection.
+# System messages are never spilled: they are few, always sent, and edited in place
+# through set_content, which also updates their token count.
+# Behaves like a list of message dicts for indexing, iteration and appending.
+class SessionStore:
+    LOADED_CACHE_SIZE = 64
+
+    def __init__(self, directory, conversation_id, hot_messages=200):
+        import tempfile
+        from array import array
+
+        self.hot_messages = max(hot_messages, 2)
+        self.roles = []
+        self.tokens = []
+
+        # Messages [0, spilled) are on disk, except system messages kept in resident
+        self.spilled = 0
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        self.resident = {}
+        self.hot = []
+        self.hot_reasoning = []
+        self.loaded = OrderedDict()
+
+        # An anonymous file, removed by the OS however the session ends
+        os.makedirs(directory, exist_ok=True)
+        self.segment = tempfile.TemporaryFile(prefix=f"{conversation_id}-", suffix=".segment", dir=directory)
+
+    # A store holding messages, e.g. a replayed journal; a "reasoning_content" field
+    # is stored as the message's reasoning rather than as part of the message
+    @classmethod
+    def from_messages(cls, directory, conversation_id, messages, hot_messages=200):
+        store = cls(directory, conversation_id, hot_messages)
+        for message in messages:
+            reasoning = message.get("reasoning_content")
+            if reasoning is not None:
+                message = {key: value for key, value in message.items() if key != "reasoning_content"}
+            store.append(message, reasoning)
+        return store
+
+    def __len__(self):
+        return len(self.roles)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._record(index)["message"]
+
+    def append(self, message, reasoning=None):
+        self.roles.append(message["role"])
+        self.tokens.append(message_tokens(message))
+        self.hot.append(message)
+        self.hot_reasoning.append(reasoning)
+
+        if len(self.hot) > self.hot_messages:
+            self._spill(len(self.hot) - self.hot_messages // 2)
+
+    # Remove and return the last message, which is always in memory
+    def pop(self):
+        self.roles.pop()
+        self.tokens.pop()
+        self.hot_reasoning.pop()
+        return self.hot.pop()
+
+    # Replace a message's content, keeping its token count in step. Spilled messages
+    # are rewritten as a new record at the end of the segment file.
+    def set_content(self, index, content):
+        if index < 0:
+            index += len(self)
+        record = self._record(index)
+        record["message"]["content"] = content
+        self.tokens[index] = message_tokens(record["message"])
+
+        if index < self.spilled and index not in self.resident:
+            self.segment.seek(0, os.SEEK_END)
+            self.offsets[index] = self.segment.tell()
+            data = zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+            self.segment.write(data)
+            self.segment.flush()
+            self.lengths[index] = len(data)
+
+    # Chain of thought behind an answer, if it was kept
+    def reasoning(self, index):
+        return self._record(index).get("reasoning")
+
+    # Delete the segment file
+    def close(self):
+        self.segment.close()
+
+    def _record(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+
+        if index >= self.spilled:
+            return {"message": self.hot[index - self.spilled], "reasoning": self.hot_reasoning[index - self.spilled]}
+        if index in self.resident:
+            return {"message": self.resident[index]}
+
+        record = self.loaded.get(index)
+        if record is None:
+            self.segment.seek(self.offsets[index])
+            record = json.loads(zlib.decompress(self.segment.read(self.lengths[index])))
+            self.loaded[index] = record
+            if len(self.loaded) > self.LOADED_CACHE_SIZE:
+                self.loaded.popitem(last=False)
+        else:
+            self.loaded.move_to_end(index)
+
+        return record
+
+    # Move the oldest count in-memory messages to the segment file
+    def _spill(self, count):
+        self.segment.seek(0, os.SEEK_END)
+        for message, reasoning in zip(self.hot[:count], self.hot_reasoning[:count]):
+            if message["role"] == "system":
+                self.resident[self.spilled] = message
+                offset, data = 0, b""
+            else:
+                offset = self.segment.tell()
+                data = zlib.compress(json.dumps(
+                    {"message": message, "reasoning": reasoning}, ensure_ascii=False
+                ).encode("utf-8"))
+                self.segment.write(data)
+            self.offsets.append(offset)
+            self.lengths.append(len(data))
+            self.spilled += 1
+
+        self.segment.flush()
+        del self.hot[:count]
+        del self.hot_reasoning[:count]
+
+# Select the messages to send so their estimated size fits the token budget.
+# Leading system messages and the latest turn are always kept; older turns
+# (a user message and the replies to it) are dropped oldest first. System
+# messages added later in the conversation are instructions, so they are kept
+# even when the turn they were added in is dropped.
+# Returns the selected messages, sent tokens, trimmed tokens and trimmed message count.
+def fit_context(messages, budget):
+    roles, tokens = message_index(messages)
+    start = 0
+    while start < len(roles) and roles[start] == "system":
+        start += 1
+
+    # The rest of the conversation is grouped into turns starting at each user message
+    turn_starts = [i for i in range(start, len(roles)) if roles[i] == "user" or i == start]
+    later_system = [i for i in range(start, len(roles)) if roles[i] == "system"]
+
+    sent_tokens = sum(tokens[:start]) + sum(tokens[i] for i in later_system)
+    kept_from = len(roles)
+    for n, turn_start in enumerate(reversed(turn_starts)):
+        turn_tokens = sum(tokens[i] for i in range(turn_start, kept_from) if roles[i] != "system")
+        if n > 0 and sent_tokens + turn_tokens > budget:
+            break
+        sent_tokens += turn_tokens
+        kept_from = turn_start
+
+    pinned = list(range(start)) + [i for i in later_system if i < kept_from]
+    trimmed = [i for i in range(start, kept_from) if roles[i] != "system"]
+    selected = [messages[i] for i in pinned + list(range(kept_from, len(roles)))]
+    trimmed_tokens = sum(tokens[i] for i in trimmed)
+
+    return selected, sent_tokens, trimmed_tokens, len(trimmed)
+
+# Context selection that keeps the sent prefix byte-stable between requests, so
+# DeepSeek's context cache can serve everything but the newest turn. fit_context
+# trims a little on every turn once the conversation is over budget, which shifts
+# the prefix and misses the cache each time; here older turns are only dropped at
+# checkpoints, and then down to `compact_to` of the budget so the prefix stays
+# fixed for many turns afterwards. System messages from dropped turns are moved
+# to the front, which only changes the prefix at the same checkpoints.
+class StablePrefix:
+    def __init__(self, compact_to=0.5):
+        self.compact_to = compact_to
+        self.start = None
+        self.previous = []
+        self.checkpoints = 0
+
+    # Start over, e.g. after loading another conversation
+    def reset(self):
+        self.start = None
+
+    # Same return values as fit_context, plus the tokens of the previous request's
+    # messages that are sent again unchanged at the start of this one
+    def fit(self, messages, budget):
+        roles, tokens = message_index(messages)
+        leading = 0
+        while leading < len(roles) and roles[leading] == "system":
+            leading += 1
+        if self.start is None or not leading <= self.start < len(roles):
+            self.start = leading
+            self.previous = []
+
+        sent_tokens = self._tokens(roles, tokens, self.start)
+        if sent_tokens > budget:
+            # Checkpoint: drop whole turns until the context is down to compact_to
+            # of the budget, always keeping the latest turn
+            target = budget * self.compact_to
+            for start in range(self.start + 1, len(roles)):
+                if roles[start] != "user":
+                    continue
+                self.start = start
+                sent_tokens = self._tokens(roles, tokens, start)
+                if sent_tokens <= target:
+                    break
+            self.checkpoints += 1
+
+        context = [messages[i] for i in range(self.start) if roles[i] == "system"]
+        context += [messages[i] for i in range(self.start, len(roles))]
+        trimmed = [i for i in range(self.start) if roles[i] != "system"]
+
+        # Tokens of the longest common prefix with the previous request
+        reused_tokens = 0
+        for sent, previous in zip(context, self.previous):
+            if sent is not previous and sent != previous:
+                break
+            reused_tokens += message_tokens(sent)
+        self.previous = list(context)
+
+        trimmed_tokens = sum(tokens[i] for i in trimmed)
+        return context, sent_tokens, trimmed_tokens, len(trimmed), reused_tokens
+
+    # Tokens sent when the conversation starts at `start`: system messages before it and everything after
+    @staticmethod
+    def _tokens(roles, tokens, start):
+        return sum(tokens[i] for i in range(start) if roles[i] == "system") + sum(tokens[start:])
+
+# Index of the oldest message a fitted context still sends, apart from system
+# messages, given the number of messages fit_context or StablePrefix trimmed
+def first_sent_index(messages, trimmed_count):
+    roles, _ = message_index(messages)
+    index = 0
+    while index < len(roles) and (roles[index] == "system" or trimmed_count):
+        if roles[index] != "system":
+            trimmed_count -= 1
+        index += 1
+
+    return index
+
+# The system message in effect: the latest one, including instructions added later
+def current_system_message(messages):
+    roles, _ = message_index(messages)
+    index = next((i for i in range(len(roles) - 1, -1, -1) if roles[i] == "system"), None)
+    return messages[index]["content"] if index is not None else ""
+
+# HTTP timeouts and connection pool limits from the parameters
+def http_settings(params, min_connections=1):
+    import httpx
+    from openai import Timeout
+
+    max_connections = max(params["max_connections"], min_connections)
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=params["keepalive_expiry"]
+    )
+    timeout = Timeout(params["read_timeout"], connect=params["connect_timeout"])
+
+    # HTTP/2 needs the optional h2 package
+    http2 = params["http2"]
+    if http2 and importlib.util.find_spec("h2") is None:
+        console.print("[yellow]HTTP/2 needs the h2 package (pip install h2), using HTTP/1.1.[/yellow]")
+        http2 = False
+
+    return limits, timeout, http2
+
+# Per-request timeout for a request that must finish within `seconds`; the
+# client's read and connect timeouts apply if they are shorter
+def request_timeout(params, seconds):
+    from openai import Timeout
+
+    return Timeout(min(params["read_timeout"], seconds), connect=min(params["connect_timeout"], seconds))
+
+# Create the pooled HTTP client used by the API client
+def create_http_client(params):
+    from openai import DefaultHttpxClient
+
+    limits, timeout, http2 = http_settings(params)
+    return DefaultHttpxClient(limits=limits, timeout=timeout, http2=http2)
+
+# Create the API client. openai is by far the slowest import, so it happens here
+# rather than at startup.
+def create_client(params, http_client=None):
+    from openai import OpenAI
+
+    # Retries are handled by RequestPolicy
+    http_client = http_client or create_http_client(params)
+    return OpenAI(api_key=params["api_key"], base_url=params["base_url"], max_retries=0,
+                  timeout=http_client.timeout, http_client=http_client)
+
+# Opens the connection to the API in the background while the user is still
+# configuring or typing, so the first request does not pay for importing openai
+# or for DNS, TCP and TLS setup. While idle it pings the server often enough to
+# keep the pooled connection from expiring between turns.
+class ConnectionWarmer:
+    # Stop pinging after this long without a request
+    MAX_IDLE_SECONDS = 900
+
+    def __init__(self, params):
+        self.params = dict(params)
+        self.http_client = None
+        self.ready = threading.Event()
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _ping(self):
+        try:
+            # Any response will do, the point is an open connection in the pool
+            self.http_client.head(self.params["base_url"], timeout=self.params["connect_timeout"])
+        except Exception:
+            pass
+
+    def _run(self):
+        try:
+            self.http_client = create_http_client(self.params)
+            self._ping()
+        except Exception:
+            self.http_client = None
+        finally:
+            self.ready.set()
+
+        if self.http_client is None or not self.params["keepalive_expiry"]:
+            return
+
+        interval = max(min(self.params["keepalive_expiry"] / 2, 30.0), 1.0)
+        while not self.stopped.wait(interval):
+            idle = time.monotonic() - self.last_used
+            if not self.in_flight and interval <= idle < self.MAX_IDLE_SECONDS:
+                self._ping()
+
+    # Whether the pool was opened with the same connection settings as params
+    def matches(self, params):
+        return all(self.params[key] == params[key] for key in CONNECTION_PARAMS)
+
+    # API client sharing the warm connection pool
+    def client(self, params):
+        self.ready.wait()
+        return create_client(params, self.http_client)
+
+    # Mark a request as in flight, so idle pings do not compete with it
+    def begin(self):
+        self.in_flight += 1
+        self.last_used = time.monotonic()
+
+    def end(self):
+        self.in_flight -= 1
+        self.last_used = time.monotonic()
+
+# Build the keyword arguments for a chat completion request
+def build_request(params, messages) -> Dict[str, Any]:
+    return {
+        "model": params["model"],
+        "messages": messages,
+        "temperature": params["temperature"],
+        "max_tokens": params["max_tokens"],
+        "top_p": params["top_p"],
+        "frequency_penalty": params["frequency_penalty"],
+        "presence_penalty": params["presence_penalty"],
+    }
+
+# Section headings printed above the reasoning and the answer
+REASONING_HEADING = "\n[bold magenta]Chain of Thought:[/bold magenta]"
+ANSWER_HEADING = "\n[bold green]Final Answer:[/bold green]"
+
+# Rate limits (429), server errors (5xx) and dropped connections are worth retrying
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+
+    from openai import APIConnectionError
+
+    return isinstance(error, APIConnectionError)
+
+# Exponential backoff with full jitter, honouring Retry-After when the server sends it
+def retry_delay(error, attempt, base=1.0, cap=60.0):
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+
+    try:
+        return min(float(retry_after), cap)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+# Raised when a model misses its first-token or total deadline
+class DeadlineExceeded(Exception):
+    pass
+
+# Runs requests under the timeout, retry, hedging and fallback settings.
+# Each attempt runs on a worker thread until it produces its first chunk (or,
+# without streaming, the whole response), so the caller can give up on it,
+# retry it, or race a hedged duplicate against it.
+class RequestPolicy:
+    # Completed requests needed before the hedge delay is taken from their p95
+    HEDGE_MIN_SAMPLES = 5
+
+    def __init__(self, params, telemetry=None):
+        self.params = params
+        self.telemetry = telemetry
+
+    # Delay before hedging: the p95 time to first token seen for this model, once known
+    def hedge_delay(self, model):
+        if self.telemetry:
+            samples = self.telemetry.values("ttft_seconds", model)
+            if len(samples) >= self.HEDGE_MIN_SAMPLES:
+                return percentile(sorted(samples), 0.95)
+
+        return self.params["hedge_delay"]
+
+    # Start a streaming request and wait for its first chunk.
+    # Returns the stream, an iterator over the remaining chunks, the first chunk and how it was served.
+    def open_stream(self, client, params, messages):
+        request = build_request(params, messages)
+
+        def attempt(track):
+            stream = client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True},
+                                                    timeout=request_timeout(params, params["total_timeout"]))
+            track(stream)
+            chunks = iter(stream)
+            return stream, chunks, next(chunks, None)
+
+        (stream, chunks, first_chunk), served = self._run(params["model"], attempt, params["first_token_timeout"])
+        return stream, chunks, first_chunk, served
+
+    # Wait for a complete response; returns reasoning, answer, usage and how it was served.
+    # The response is still read as a stream, so cancelling or losing the race closes
+    # the request instead of leaving it running until the server finishes.
+    def fetch(self, client, params, messages):
+        request = build_request(params, messages)
+
+        def attempt(track):
+            stream = client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True},
+                                                    timeout=request_timeout(params, params["total_timeout"]))
+            track(stream)
+            reasoning_parts = []
+            answer_parts = []
+            usage = None
+
+            with stream:
+                for chunk in stream:
+                    # The final usage chunk carries no choices
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+
+                    delta = chunk.choices[0].delta
+                    if getattr(delta, 'reasoning_content', None):
+                        reasoning_parts.append(delta.reasoning_content)
+                    if delta.content:
+                        answer_parts.append(delta.content)
+
+            return "".join(reasoning_parts) or None, "".join(answer_parts), usage
+
+        (reasoning_content, final_answer, usage), served = self._run(params["model"], attempt, params["total_timeout"])
+        return reasoning_content, final_answer, usage, served
+
+    # Retry retryable errors with backoff; deadline misses go back to the caller for fallback
+    def _run(self, model, attempt, timeout):
+        retries = self.params["retries"]
+
+        for attempt_number in range(retries + 1):
+            try:
+                result, hedged = self._race(model, attempt, timeout)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if attempt_number < retries and is_retryable(e):
+                    delay = retry_delay(e, attempt_number)
+                    console.print(f"[yellow]{str(e)} - retrying in {delay:.1f} s ({attempt_number + 1}/{retries})[/yellow]")
+                    time.sleep(delay)
+                    continue
+                raise
+
+            served = model
+            if attempt_number:
+                served += f", retry {attempt_number}"
+            if hedged:
+                served += ", hedged request"
+            return result, served
+
+    # Run an attempt, plus a hedged duplicate if enabled and the first is slow.
+    # Returns the first successful result and whether the hedge produced it.
+    def _race(self, model, attempt, timeout):
+        results = queue.Queue()
+        lock = threading.Lock()
+        streams = []
+        finished = False
+
+        # Streams opened by the attempts; those that lose the race or time out are
+        # closed as soon as possible, which also unblocks their worker threads
+        def track(stream, owned):
+            with lock:
+                if finished:
+                    stream.close()
+                else:
+                    streams.append(stream)
+                    owned.append(stream)
+
+        def worker(hedged):
+            owned = []
+            try:
+                result, error = attempt(lambda stream: track(stream, owned)), None
+            except Exception as e:
+                result, error = None, e
+
+            with lock:
+                if not finished:
+                    results.put((hedged, result, error, owned))
+
+        def finish(keep=()):
+            nonlocal finished
+            with lock:
+                finished = True
+                for stream in streams:
+                    if stream not in keep:
+                        stream.close()
+
+        threading.Thread(target=worker, args=(False,), daemon=True).start()
+        started = time.perf_counter()
+        deadline = started + timeout
+        hedge_at = started + self.hedge_delay(model) if self.params["hedge"] else None
+        running = 1
+
+        while True:
+            now = time.perf_counter()
+            wait = deadline - now
+            if hedge_at is not None:
+                wait = min(wait, hedge_at - now)
+
+            try:
+                hedged, result, error, owned = results.get(timeout=max(wait, 0))
+            except queue.Empty:
+                now = time.perf_counter()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    running += 1
+                    threading.Thread(target=worker, args=(True,), daemon=True).start()
+                    continue
+                if now >= deadline:
+                    finish()
+                    raise DeadlineExceeded(f"no response from {model} within {timeout:g} s")
+                continue
+            except KeyboardInterrupt:
+                # Cancelled by the user: drop every attempt
+                finish()
+                raise
+
+            if error is not None:
+                running -= 1
+                # The other attempt may still succeed; otherwise let _run decide on a retry
+                if running:
+                    continue
+                finish()
+                raise error
+
+            finish(keep=owned)
+            return result, hedged
+
+# The chunks of an open stream, raising DeadlineExceeded once params["total_timeout"]
+# has passed since `started`. A stalled stream produces no chunks to check the time
+# on, so a watchdog timer closes it at the deadline, which ends the blocked read.
+def deadline_chunks(stream, chunks, first_chunk, params, started):
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        stream.close()
+
+    watchdog = threading.Timer(max(started + params["total_timeout"] - time.perf_counter(), 0), expire)
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        try:
+            for chunk in itertools.chain([first_chunk] if first_chunk else [], chunks):
+                if expired.is_set():
+                    break
+                yield chunk
+        except Exception:
+            # Reading from the stream the watchdog closed
+            if not expired.is_set():
+                raise
+
+        if expired.is_set():
+            raise DeadlineExceeded(f"{params['model']} did not finish within {params['total_timeout']:g} s")
+    finally:
+        watchdog.cancel()
+
+# Run one turn under the request policy, falling back to params["fallback_model"]
+# when the main model misses a deadline. Returns reasoning, answer and the turn metrics.
+def request_turn(client, params, messages, policy, stream=True, footer=None):
+    models = [params["model"]]
+    if params.get("fallback_model") and params["fallback_model"] != params["model"]:
+        models.append(params["fallback_model"])
+
+    for i, model in enumerate(models):
+        turn_params = dict(params, model=model)
+        metrics = TurnMetrics(model)
+
+        try:
+            if stream:
+                reasoning_content, final_answer = stream_response(client, turn_params, messages, metrics, policy, footer)
+            else:
+                reasoning_content, final_answer = fetch_response(client, turn_params, messages, metrics, policy, footer)
+        except DeadlineExceeded as e:
+            if i == len(models) - 1:
+                raise
+            console.print(f"\n[yellow]{str(e)} - falling back to {models[i + 1]}[/yellow]")
+            continue
+
+        if i:
+            metrics.served += f", fallback from {models[0]}"
+        console.print(f"[dim]Served by {metrics.served}[/dim]")
+        return reasoning_content, final_answer, metrics
+
+# Display a complete reasoning and answer pair; returns the render time
+def display_turn(reasoning_content, final_answer):
+    # Display chain of thought reasoning
+    console.print(REASONING_HEADING)
+    render_seconds = display_response(reasoning_content or "No reasoning provided", "Chain of Thought", "magenta")
+
+    # Display final answer
+    console.print(ANSWER_HEADING)
+    render_seconds += display_response(final_answer, "Final Answer", "green")
+
+    return render_seconds
+
+# Send the request, wait for the complete response and display it. A footer
+# renderable (the type-ahead line) is shown below the spinner while waiting.
+def fetch_response(client, params, messages, metrics=None, policy=None, footer=None):
+    metrics = metrics or TurnMetrics(params["model"])
+    policy = policy or RequestPolicy(params)
+
+    status = Text("Thinking...", style="bold green")
+    with console.status(Group(status, footer) if footer else status, spinner="dots"):
+        reasoning_content, final_answer, usage, metrics.served = policy.fetch(client, params, messages)
+    metrics.mark_first_token()
+    metrics.mark_finished()
+    if usage:
+        metrics.record_usage(usage)
+
+    metrics.render_seconds += display_turn(reasoning_content, final_answer)
+    return reasoning_content, final_answer
+
+# Live view of the segment that is still streaming in. Completed segments are
+# printed above it by the active renderer, so each refresh only redraws the tail.
+# An optional footer (the type-ahead line) is drawn below it.
+class StreamView:
+    def __init__(self, footer=None):
+        self.renderer = None
+        self.footer = footer
+
+    def __rich_console__(self, console, options):
+        if self.renderer is None:
+            yield Text("Waiting for the first token...", style="bold green")
+        else:
+            max_lines = max((options.height or console.size.height) // 2, 3)
+            yield Panel(
+                self.renderer.pending_renderable(max_lines),
+                title=self.renderer.title,
+                border_style=self.renderer.style
+            )
+
+        if self.footer is not None:
+            yield self.footer
+
+# Send the request and display reasoning and answer deltas as they arrive
+def stream_response(client, params, messages, metrics=None, policy=None, footer=None):
+    metrics = metrics or TurnMetrics(params["model"])
+    policy = policy or RequestPolicy(params)
+    view = StreamView(footer)
+    reasoning = ResponseRenderer("Chain of Thought", "magenta")
+    answer = ResponseRenderer("Final Answer", "green")
+    reasoning_parts = []
+    answer_parts = []
+
+    # Reasoning always precedes the answer, so it is complete once the answer starts
+    def start_answer():
+        if reasoning_parts:
+            reasoning.close()
+        else:
+            console.print(REASONING_HEADING)
+            metrics.render_seconds += display_response("No reasoning provided", "Chain of Thought", "magenta")
+
+        console.print(ANSWER_HEADING)
+        view.renderer = answer
+
+    from rich.live import Live
+
+    with Live(view, console=console, refresh_per_second=10, transient=True):
+        stream, chunks, first_chunk, metrics.served = policy.open_stream(client, params, messages)
+
+        try:
+            for chunk in deadline_chunks(stream, chunks, first_chunk, params, metrics.started):
+                # The final usage chunk carries no choices
+                if chunk.usage:
+                    metrics.record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+
+                metrics.mark_first_token()
+                delta = chunk.choices[0].delta
+                reasoning_delta = getattr(delta, 'reasoning_content', None)
+                if reasoning_delta:
+                    if not reasoning_parts:
+                        console.print(REASONING_HEADING)
+                        view.renderer = reasoning
+                    reasoning_parts.append(reasoning_delta)
+                    reasoning.feed(reasoning_delta)
+
+                if delta.content:
+                    if not answer_parts:
+                        start_answer()
+                    answer_parts.append(delta.content)
+                    answer.feed(delta.content)
+        finally:
+            stream.close()
+
+        metrics.mark_finished()
+        if not answer_parts:
+            start_answer()
+        answer.close()
+
+    metrics.render_seconds += reasoning.render_seconds + answer.render_seconds
+    return "".join(reasoning_parts) or None, "".join(answer_parts)
+
+# Timings and token usage of a single request. Times are measured from the
+# moment the request is sent; render time is what display_response spent in Rich.
+class TurnMetrics:
+    def __init__(self, model):
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.render_seconds = 0.0
+        self.usage = {}
+        self.served = model
+
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def mark_finished(self):
+        self.finished = time.perf_counter()
+
+    def record_usage(self, usage):
+        if usage is not None:
+            self.usage = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+
+    def as_record(self) -> Dict[str, Any]:
+        finished = self.finished or time.perf_counter()
+        first_token = self.first_token or finished
+        details = self.usage.get("completion_tokens_details") or {}
+        completion_tokens = self.usage.get("completion_tokens") or 0
+
+        # Generation speed after the first token; a non-streamed response has no such window
+        generation_seconds = finished - first_token if finished > first_token else finished - self.started
+
+        return {
+            "timestamp": time.time(),
+            "model": self.model,
+            "served": self.served,
+            "ttft_seconds": round(first_token - self.started, 4),
+            "latency_seconds": round(finished - self.started, 4),
+            "render_seconds": round(self.render_seconds, 4),
+            "prompt_tokens": self.usage.get("prompt_tokens") or 0,
+            "completion_tokens": completion_tokens,
+            "reasoning_tokens": details.get("reasoning_tokens") or 0,
+            "cache_hit_tokens": self.usage.get("prompt_cache_hit_tokens") or 0,
+            "cache_miss_tokens": self.usage.get("prompt_cache_miss_tokens") or 0,
+            "tokens_per_second": round(completion_tokens / generation_seconds, 2) if generation_seconds > 0 else 0.0,
+        }
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+
+    # Rounded first, so float noise such as 0.7 * 10 = 7.000000000000001 does not move up a rank
+    rank = max(math.ceil(round(fraction * len(sorted_values), 9)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+# Collects per-turn metrics for the 'stats' command, and optionally appends
+# them to a JSONL file and serves them in Prometheus text format.
+class Telemetry:
+    TIMINGS = ["ttft_seconds", "latency_seconds", "render_seconds", "tokens_per_second"]
+    COUNTERS = ["prompt_tokens", "completion_tokens", "reasoning_tokens", "cache_hit_tokens", "cache_miss_tokens"]
+
+    def __init__(self, export_path=None):
+        self.turns = []
+        self.export_path = export_path
+        self.lock = threading.Lock()
+
+    def record(self, metrics):
+        record = metrics.as_record()
+        with self.lock:
+            self.turns.append(record)
+
+        if self.export_path:
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+        return record
+
+    # Recorded values of one metric, optionally for a single model
+    def values(self, name, model=None):
+        with self.lock:
+            return [turn[name] for turn in self.turns if model is None or turn["model"] == model]
+
+    def summary(self):
+        with self.lock:
+            turns = list(self.turns)
+
+        timings = {}
+        for name in self.TIMINGS:
+            values = sorted(turn[name] for turn in turns)
+            timings[name] = {
+                "p50": percentile(values, 0.5),
+                "p90": percentile(values, 0.9),
+                "p99": percentile(values, 0.99),
+                "sum": sum(values),
+            }
+        totals = {name: sum(turn[name] for turn in turns) for name in self.COUNTERS}
+
+        return len(turns), timings, totals
+
+    def prometheus_text(self):
+        count, timings, totals = self.summary()
+        lines = [
+            "# HELP deepseek_cli_turns_total Completed chat turns",
+            "# TYPE deepseek_cli_turns_total counter",
+            f"deepseek_cli_turns_total {count}",
+        ]
+
+        for name in self.COUNTERS:
+            metric = f"deepseek_cli_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {totals[name]}"]
+
+        for name in self.TIMINGS:
+            metric = f"deepseek_cli_{name}"
+            lines.append(f"# TYPE {metric} summary")
+            for key, quantile in (("p50", "0.5"), ("p90", "0.9"), ("p99", "0.99")):
+                lines.append(f'{metric}{{quantile="{quantile}"}} {timings[name][key]}')
+            lines += [f"{metric}_sum {timings[name]['sum']}", f"{metric}_count {count}"]
+
+        return "\n".join(lines) + "\n"
+
+    # Serve /metrics on a background thread
+    def serve(self, port):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+# One-line summary printed after each answer
+def display_turn_metrics(record):
+    prompt_tokens = record["prompt_tokens"]
+    hit_ratio = f", {record['cache_hit_tokens'] / prompt_tokens:.0%} prompt cache hit" if prompt_tokens else ""
+    console.print(
+        f"[dim]First token {record['ttft_seconds']:.2f} s, total {record['latency_seconds']:.2f} s, "
+        f"render {record['render_seconds'] * 1000:.0f} ms | {prompt_tokens} prompt + "
+        f"{record['completion_tokens']} completion tokens ({record['reasoning_tokens']} reasoning){hit_ratio} | "
+        f"{record['tokens_per_second']:.1f} tokens/s[/dim]"
+    )
+
+# Helper function to display session performance statistics
+def display_stats(telemetry):
+    count, timings, totals = telemetry.summary()
+    if not count:
+        console.print("[yellow]No completed requests yet.[/yellow]")
+        return
+
+    table = Table(title=f"Performance ({count} requests)")
+    table.add_column("Metric", style="cyan")
+    table.add_column("p50", style="green", justify="right")
+    table.add_column("p90", style="green", justify="right")
+    table.add_column("p99", style="green", justify="right")
+
+    for name, label, scale, unit in (
+        ("ttft_seconds", "Time to first token", 1, "s"),
+        ("latency_seconds", "Total latency", 1, "s"),
+        ("render_seconds", "Render time", 1000, "ms"),
+        ("tokens_per_second", "Tokens/s", 1, ""),
+    ):
+        table.add_row(label, *(f"{timings[name][q] * scale:.2f} {unit}" for q in ("p50", "p90", "p99")))
+
+    console.print(table)
+
+    prompt_tokens = totals["prompt_tokens"]
+    hit_ratio = f" ({totals['cache_hit_tokens'] / prompt_tokens:.0%})" if prompt_tokens else ""
+    console.print(
+        f"Tokens: {prompt_tokens} prompt, {totals['completion_tokens']} completion "
+        f"({totals['reasoning_tokens']} reasoning), {totals['cache_hit_tokens']} prompt cache hits{hit_ratio}"
+    )
+
+# Parameters a comparison variant may change; the rest (connection settings,
+# system message) are shared by all variants
+COMPARE_PARAMS = ["model", "temperature", "max_tokens", "top_p", "frequency_penalty", "presence_penalty"]
+
+# Parse a comparison variant: a model name, parameter overrides, or both, as in
+# "deepseek-chat", "temperature=1.2" or "deepseek-reasoner:temperature=0.2,top_p=0.9".
+# Returns the label and the request parameters of the variant.
+def parse_variant(spec, params):
+    model, _, overrides = spec.partition(":")
+    if "=" in model:
+        model, overrides = "", spec
+    variant = dict(params, model=model or params["model"])
+
+    for override in filter(None, overrides.split(",")):
+        name, _, value = override.partition("=")
+        name = name.strip()
+        if name not in COMPARE_PARAMS:
+            raise ValueError(f"Cannot compare '{name}'; variants can set {', '.join(COMPARE_PARAMS)}")
+
+        variant[name] = PARAM_SCHEMA[name](value.strip())
+
+    return spec, variant
+
+# State of one variant while a comparison streams in
+class CompareColumn:
+    def __init__(self, label, params):
+        self.label = label
+        self.params = params
+        self.metrics = TurnMetrics(params["model"])
+        self.reasoning_parts = []
+        self.answer_parts = []
+        self.error = None
+        self.done = False
+        self.cancelled = False
+
+    # Status and the tail of the text streamed so far; plain text, so redraws stay cheap
+    def renderable(self, max_lines):
+        if self.error:
+            status = f"[bold red]Error:[/bold red] {escape(str(self.error))}"
+        elif self.done:
+            status = f"[green]Done in {self.metrics.as_record()['latency_seconds']:.2f} s[/green]"
+        elif self.answer_parts:
+            status = "[green]Answering...[/green]"
+        elif self.reasoning_parts:
+            status = "[magenta]Reasoning...[/magenta]"
+        else:
+            status = "[dim]Waiting for the first token...[/dim]"
+
+        text = "".join(self.answer_parts or self.reasoning_parts)
+        tail = "\n".join(text.splitlines()[-max_lines:])
+        style = "dim" if not self.answer_parts else ""
+        return Panel(Group(Text.from_markup(status), Text(tail, style=style)),
+                     title=f"[bold]{escape(self.label)}[/bold]", border_style="blue")
+
+# Stream one variant's response into its column
+def stream_variant(client, column, messages, telemetry):
+    policy = RequestPolicy(column.params, telemetry)
+    metrics = column.metrics
+
+    try:
+        stream, chunks, first_chunk, metrics.served = policy.open_stream(client, column.params, messages)
+
+        try:
+            for chunk in deadline_chunks(stream, chunks, first_chunk, column.params, metrics.started):
+                if column.cancelled:
+                    break
+                if chunk.usage:
+                    metrics.record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+
+                metrics.mark_first_token()
+                delta = chunk.choices[0].delta
+                if getattr(delta, 'reasoning_content', None):
+                    column.reasoning_parts.append(delta.reasoning_content)
+                if delta.content:
+                    column.answer_parts.append(delta.content)
+        finally:
+            stream.close()
+
+        metrics.mark_finished()
+    except Exception as e:
+        column.error = e
+    finally:
+        column.done = True
+
+# Send the same conversation to several variants at once and show the answers
+# side by side. Each variant streams on its own thread over the shared connection
+# pool, so the wall time is that of the slowest variant rather than the sum.
+# Returns the columns of the variants.
+def compare_variants(client, params, messages, specs, telemetry=None):
+    from rich.live import Live
+
+    columns = [CompareColumn(*parse_variant(spec, params)) for spec in specs]
+
+    # Every variant needs its own connection to run concurrently
+    if len(columns) > params["max_connections"]:
+        client = create_client(params, create_http_client(dict(params, max_connections=len(columns))))
+
+    def layout():
+        max_lines = max(console.size.height // 2, 3)
+        grid = Table.grid(expand=True, padding=(0, 1))
+        for _ in columns:
+            grid.add_column(ratio=1)
+        grid.add_row(*(column.renderable(max_lines) for column in columns))
+        return grid
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=stream_variant, args=(client, column, messages, telemetry), daemon=True)
+        for column in columns
+    ]
+    with Live(get_renderable=layout, console=console, refresh_per_second=10, transient=True):
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            # Each variant closes its stream at the next chunk
+            for column in columns:
+                column.cancelled = True
+            raise
+    wall_seconds = time.perf_counter() - started
+
+    # The final answers, rendered once each, side by side
+    answers = Table(expand=True, show_lines=True)
+    for column in columns:
+        answers.add_column(escape(column.label), ratio=1)
+    answers.add_row(*(
+        Text(f"Error: {column.error}", style="bold red") if column.error
+        else Group(*response_renderables("".join(column.answer_parts), None))
+        for column in columns
+    ))
+    console.print(answers)
+
+    table = Table(title=f"Comparison (wall time {wall_seconds:.2f} s)")
+    table.add_column("Variant", style="cyan", overflow="fold")
+    for heading in ("First token", "Total", "Prompt", "Completion", "Reasoning", "Tokens/s"):
+        table.add_column(heading, justify="right")
+
+    for column in columns:
+        if column.error:
+            table.add_row(escape(column.label), "[red]failed[/red]", "", "", "", "", "")
+            continue
+
+        record = telemetry.record(column.metrics) if telemetry else column.metrics.as_record()
+        table.add_row(
+            escape(column.label),
+            f"{record['ttft_seconds']:.2f} s",
+            f"{record['latency_seconds']:.2f} s",
+            str(record["prompt_tokens"]),
+            str(record["completion_tokens"]),
+            str(record["reasoning_tokens"]),
+            f"{record['tokens_per_second']:.1f}",
+        )
+
+    console.print(table)
+    return columns
+
+# Content-addressed on-disk cache of responses. Each entry is a JSON file named by
+# the hash of the full request (model, sampling parameters and messages). File
+# modification times track last use, so eviction removes the least recently used
+# entries once the directory grows past max_bytes.
+class ResponseCache:
+    def __init__(self, directory, max_bytes, ttl_seconds):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(request):
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    # Return (reasoning_content, content) for a cached request, or None
+    def get(self, request):
+        path = self._path(self.key(request))
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if time.time() - entry["created"] > self.ttl_seconds:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Mark as recently used
+        os.utime(path)
+        self.hits += 1
+        return entry["reasoning_content"], entry["content"]
+
+    def put(self, request, reasoning_content, content):
+        path = self._path(self.key(request))
+        entry = {
+            "created": time.time(),
+            "model": request["model"],
+            "reasoning_content": reasoning_content,
+            "content": content,
+        }
+
+        # Write to a temporary file first so readers never see a partial entry
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+        self._evict()
+
+    def _entries(self):
+        with os.scandir(self.directory) as it:
+            return [entry for entry in it if entry.name.endswith(".json")]
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # Remove least recently used entries until the cache fits in max_bytes
+    def _evict(self):
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._entries()]
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(entry.stat().st_size for entry in entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def clear(self):
+        entries = self._entries()
+        for entry in entries:
+            self._remove(entry.path)
+        return len(entries)
+
+# Open the response cache if enabled
+def open_cache(args):
+    if not args.cache:
+        return None
+
+    return ResponseCache(args.cache_dir, int(args.cache_size_mb * 1024 * 1024), args.cache_ttl_hours * 3600)
+
+# Helper function to display response cache statistics
+def display_cache_stats(cache):
+    stats = cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else "n/a"
+
+    table = Table(title="Response Cache")
+    table.add_column("Statistic", style="cyan")
+    table.add_column("Value", style="green")
+    table.add_row("Directory", cache.directory)
+    table.add_row("Entries", str(stats["entries"]))
+    table.add_row("Size", f"{stats['size_bytes'] / 1024 / 1024:.2f} MB of {cache.max_bytes / 1024 / 1024:.0f} MB")
+    table.add_row("Session hits / misses", f"{stats['hits']} / {stats['misses']} ({hit_rate})")
+
+    console.print(table)
+
+# List the available profiles and what each one sets
+def display_profiles(profiles, active=None):
+    table = Table(title="Profiles")
+    table.add_column("Profile", style="cyan")
+    table.add_column("Parameters", style="green")
+
+    for name, values in profiles.items():
+        settings = ", ".join(f"{key}={value}" for key, value in values.items() if key != "system_message")
+        if "system_message" in values:
+            settings = ", ".join(filter(None, [settings, "custom system message"]))
+        table.add_row(f"{name} (active)" if name == active else name, escape(settings))
+
+    console.print(table)
+    console.print("[dim]Switch with '/profile NAME'.[/dim]")
+
+# Token bucket for batch requests or tokens per minute. The bucket holds one
+# minute's worth, so bursts are allowed while the average stays under the limit.
+# A limit of 0 disables it.
+class RateLimiter:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        import asyncio
+
+        if not self.rate:
+            return
+
+        # Waiters queue on the lock, so they are served in arrival order.
+        # It is created here so that it belongs to the running event loop.
+        self.lock = self.lock or asyncio.Lock()
+        async with self.lock:
+            amount = min(amount, self.capacity)
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+    # Account for usage only known after the fact, such as completion tokens
+    def debit(self, amount):
+        if self.rate:
+            self._refill()
+            self.available -= amount
+
+# Read batch items from a JSONL file, numbering items without an explicit id
+def read_batch_items(path):
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", line_number)
+            items.append(item)
+
+    return items
+
+# IDs that already have a successful result, so a rerun can skip them
+def completed_batch_ids(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave a truncated last line
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+
+    return done
+
+# Send one batch item, retrying retryable errors, and return its output record
+async def run_batch_item(client, params, item, request_limiter, token_limiter, max_retries):
+    import asyncio
+
+    messages = item.get("messages") or [
+        {"role": "system", "content": params["system_message"]},
+        {"role": "user", "content": item["prompt"]}
+    ]
+    request = build_request(params, messages)
+    prompt_tokens = sum(message_tokens(message) for message in messages)
+
+    for attempt in range(max_retries + 1):
+        await request_limiter.acquire()
+        await token_limiter.acquire(prompt_tokens)
+        start = time.perf_counter()
+
+        try:
+            response = await client.chat.completions.create(**request, stream=False)
+        except Exception as e:
+            if attempt < max_retries and is_retryable(e):
+                await asyncio.sleep(retry_delay(e, attempt))
+                continue
+            return {"id": item["id"], "error": str(e)}
+
+        usage = response.usage.model_dump() if response.usage else {}
+        token_limiter.debit(usage.get("completion_tokens", 0))
+
+        message = response.choices[0].message
+        return {
+            "id": item["id"],
+            "content": message.content,
+            "reasoning_content": getattr(message, 'reasoning_content', None),
+            "usage": usage,
+            "latency": round(time.perf_counter() - start, 3),
+            "attempts": attempt + 1,
+        }
+
+# Run every pending item of a batch file with bounded concurrency
+async def run_batch_async(args, params):
+    import asyncio
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    from rich.progress import Progress
+
+    items = read_batch_items(args.batch)
+    done = completed_batch_ids(args.output)
+    pending = [item for item in items if item["id"] not in done]
+
+    console.print(f"[bold blue]Batch:[/bold blue] {len(items)} prompts, {len(items) - len(pending)} already done, "
+                  f"{len(pending)} to run with concurrency {args.concurrency}")
+
+    # Retries are handled here so they can be paced by the rate limiter
+    limits, timeout, http2 = http_settings(params, min_connections=args.concurrency)
+    http_client = DefaultAsyncHttpxClient(limits=limits, timeout=timeout, http2=http2)
+    client = AsyncOpenAI(api_key=params["api_key"], base_url=params["base_url"], max_retries=0,
+                         timeout=timeout, http_client=http_client)
+    request_limiter = RateLimiter(args.rpm)
+    token_limiter = RateLimiter(args.tpm)
+    work = asyncio.Queue()
+    for position, item in enumerate(pending):
+        work.put_nowait((position, item))
+
+    # Results waiting for earlier items when writing in input order
+    waiting = {}
+    next_position = 0
+    totals = {"ok": 0, "failed": 0, "tokens": 0, "completion_tokens": 0}
+    start = time.perf_counter()
+
+    with open(args.output, "a", encoding="utf-8") as out, Progress(console=console) as progress:
+        task = progress.add_task("Running batch", total=len(pending))
+
+        def write(record):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+        async def worker():
+            nonlocal next_position
+            while not work.empty():
+                position, item = work.get_nowait()
+                record = await run_batch_item(client, params, item, request_limiter, token_limiter, args.max_retries)
+
+                if "error" in record:
+                    totals["failed"] += 1
+                else:
+                    totals["ok"] += 1
+                    totals["tokens"] += record["usage"].get("total_tokens", 0)
+                    totals["completion_tokens"] += record["usage"].get("completion_tokens", 0)
+                progress.advance(task)
+
+                if args.batch_order == "completed":
+                    write(record)
+                    continue
+
+                waiting[position] = record
+                while next_position in waiting:
+                    write(waiting.pop(next_position))
+                    next_position += 1
+
+        await asyncio.gather(*(worker() for _ in range(max(args.concurrency, 1))))
+
+    await client.close()
+    elapsed = time.perf_counter() - start
+
+    table = Table(title="Batch Complete")
+    table.add_column("Statistic", style="cyan")
+    table.add_column("Value", style="green")
+    table.add_row("Succeeded / failed", f"{totals['ok']} / {totals['failed']}")
+    table.add_row("Elapsed", f"{elapsed:.1f} s")
+    table.add_row("Requests/s", f"{totals['ok'] / elapsed:.2f}" if elapsed else "n/a")
+    table.add_row("Tokens/s (total)", f"{totals['tokens'] / elapsed:.1f}" if elapsed else "n/a")
+    table.add_row("Tokens/s (completion)", f"{totals['completion_tokens'] / elapsed:.1f}" if elapsed else "n/a")
+    table.add_row("Output", args.output)
+    console.print(table)
+
+def run_batch(args, params):
+    import asyncio
+
+    asyncio.run(run_batch_async(args, params))
+
+# Create a new conversation ID; IDs sort by creation time
+def new_conversation_id():
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + os.urandom(3).hex()
+
+# Local write-ahead journal of a conversation. Every message is appended as a
+# JSON line {"index": i, "message": {...}} and fsynced before returning, so a
+# crash never loses a completed turn. Rewriting an index (the system message)
+# appends a new record; replay keeps the last one.
+class ConversationJournal:
+    def __init__(self, directory, conversation_id):
+        self.conversation_id = conversation_id
+        self.path = os.path.join(directory, f"{conversation_id}.jsonl")
+        os.makedirs(directory, exist_ok=True)
+
+    # Record a message; the reasoning behind an answer is kept next to it for later review
+    def append(self, index, message, reasoning=None):
+        record = {"index": index, "message": message}
+        if reasoning:
+            record["reasoning"] = reasoning
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    # Bytes appended since offset, up to the last complete line
+    def read_from(self, offset):
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return b""
+
+        return data[:data.rfind(b"\n") + 1]
+
+    # Rebuild a messages list from journal lines. Answers carry their reasoning as
+    # "reasoning_content", which SessionStore.from_messages keeps out of the messages sent.
+    @staticmethod
+    def replay(lines):
+        messages = []
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            message = record["message"]
+            if record.get("reasoning"):
+                message = dict(message, reasoning_content=record["reasoning"])
+            if record["index"] < len(messages):
+                messages[record["index"]] = message
+            else:
+                messages.append(message)
+
+        return messages
+
+# Conversation storage in S3. Journals are uploaded as gzip-compressed deltas
+# (parts) by a background thread, so each save only sends what was appended
+# since the previous one. A small manifest per conversation lists its parts.
+# AWS_S3_ENDPOINT_URL points the client at an S3-compatible stand-in such as MinIO.
+class S3Storage:
+    def __init__(self, bucket, prefix="conversations"):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("Saving and loading conversations requires boto3 (pip install boto3)")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3 = boto3.client("s3", endpoint_url=os.getenv("AWS_S3_ENDPOINT_URL") or None)
+
+        # Upload state per conversation: journal bytes uploaded and the part list
+        self.state = {}
+        self.errors = []
+        self.uploads = queue.Queue()
+        self.worker = threading.Thread(target=self._upload_loop, daemon=True)
+        self.worker.start()
+
+    def _key(self, conversation_id, name):
+        return f"{self.prefix}/{conversation_id}/{name}"
+
+    # Queue an upload of whatever the journal gained since the last save
+    def save(self, journal):
+        self.uploads.put(journal)
+
+    # Block until queued uploads have finished
+    def wait(self):
+        self.uploads.join()
+
+    def _upload_loop(self):
+        while True:
+            journal = self.uploads.get()
+            try:
+                self._upload(journal)
+            except Exception as e:
+                # Offsets only advance on success, so the next save retries this delta
+                self.errors.append(f"Upload of {journal.conversation_id} failed: {e}")
+            finally:
+                self.uploads.task_done()
+
+    def _upload(self, journal):
+        state = self.state.setdefault(journal.conversation_id, {"bytes": 0, "parts": []})
+        data = journal.read_from(state["bytes"])
+        if not data:
+            return
+
+        part_key = self._key(journal.conversation_id, f"part-{len(state['parts']):06d}.jsonl.gz")
+        self.s3.put_object(Bucket=self.bucket, Key=part_key, Body=gzip.compress(data),
+                           ContentType="application/x-ndjson", ContentEncoding="gzip")
+
+        parts = state["parts"] + [{"key": part_key, "bytes": len(data)}]
+        manifest = {
+            "id": journal.conversation_id,
+            "bytes": state["bytes"] + len(data),
+            "parts": parts,
+            "updated": time.time(),
+        }
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(journal.conversation_id, "manifest.json"),
+                           Body=json.dumps(manifest).encode("utf-8"), ContentType="application/json")
+
+        state["bytes"] = manifest["bytes"]
+        state["parts"] = parts
+
+    # Most recent conversation IDs in the bucket
+    def list_conversations(self, limit=10):
+        ids = []
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/", Delimiter="/"):
+            for common_prefix in page.get("CommonPrefixes", []):
+                ids.append(common_prefix["Prefix"][len(self.prefix) + 1:].rstrip("/"))
+
+        return sorted(ids, reverse=True)[:limit]
+
+    # Yield journal lines of a conversation, downloading and decompressing one part at a time
+    def _iter_lines(self, manifest):
+        for part in manifest["parts"]:
+            body = self.s3.get_object(Bucket=self.bucket, Key=part["key"])["Body"]
+            with gzip.GzipFile(fileobj=body) as f:
+                for line in f:
+                    yield line
+
+    # Restore a conversation into the local journal and return its messages.
+    # A local journal that is already as long as the stored one is used as is.
+    def load(self, conversation_id, journal_dir):
+        body = self.s3.get_object(Bucket=self.bucket, Key=self._key(conversation_id, "manifest.json"))["Body"]
+        manifest = json.loads(body.read())
+        journal = ConversationJournal(journal_dir, conversation_id)
+
+        if journal.size() < manifest["bytes"]:
+            temp_path = f"{journal.path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                for line in self._iter_lines(manifest):
+                    f.write(line)
+            os.replace(temp_path, journal.path)
+
+        self.state[conversation_id] = {"bytes": manifest["bytes"], "parts": manifest["parts"]}
+        with open(journal.path, encoding="utf-8") as f:
+            messages = ConversationJournal.replay(f)
+
+        return journal, messages
+
+# Create the S3 storage from the environment, reporting what is missing
+def open_storage():
+    bucket = os.getenv("AWS_S3_BUCKET")
+    if not bucket:
+        console.print("[bold red]Error:[/bold red] AWS_S3_BUCKET is not set. Add it to your .env file to use save/load.")
+        return None
+
+    try:
+        return S3Storage(bucket)
+    except RuntimeError as e:
+        console.print(f"[bold red]Error:[/bold red] {str(e)}")
+        return None
+
+# Helper function to pick a stored conversation to load
+def choose_conversation(storage):
+    conversation_ids = storage.list_conversations()
+    if not conversation_ids:
+        console.print("[yellow]No saved conversations found.[/yellow]")
+        return None
+
+    console.print("[bold]Saved conversations:[/bold]")
+    for i, conversation_id in enumerate(conversation_ids):
+        console.print(f"[cyan]{i+1}.[/cyan] {conversation_id}")
+
+    choice = Prompt.ask(
+        "Enter your choice",
+        choices=[str(i+1) for i in range(len(conversation_ids))],
+        default="1"
+    )
+    return conversation_ids[int(choice)-1]
+
+# Full-text index over every conversation journaled on this machine, kept in
+# SQLite FTS5 next to the journals. Messages are stored in a regular table and
+# mirrored into an external-content FTS table by triggers, so adding a turn is a
+# single upsert and re-indexing a loaded conversation is idempotent.
+class SearchIndex:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            conversation_id TEXT NOT NULL,
+            message_index INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created REAL NOT NULL,
+            UNIQUE (conversation_id, message_index, role)
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            content, content='entries', content_rowid='id', tokenize='porter unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts (rowid, content) VALUES (new.id, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO entries_fts (rowid, content) VALUES (new.id, new.content);
+        END;
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+
+    # Index messages of a conversation; role "reasoning" holds an answer's chain of thought
+    def add(self, conversation_id, entries):
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO entries (conversation_id, message_index, role, content, created) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (conversation_id, message_index, role) DO UPDATE SET content = excluded.content",
+                [(conversation_id, index, role, content, now) for index, role, content in entries if content]
+            )
+
+    # Index every user and assistant message of a conversation
+    def add_messages(self, conversation_id, messages):
+        self.add(conversation_id, [
+            (i, message["role"], message["content"])
+            for i, message in enumerate(messages) if message["role"] != "system"
+        ])
+
+    # Ranked matches as (conversation_id, message_index, role, snippet, created).
+    # Snippet matches are wrapped in \x02 and \x03.
+    def search(self, query, limit=10):
+        sql = (
+            "SELECT e.conversation_id, e.message_index, e.role, "
+            "snippet(entries_fts, 0, char(2), char(3), '...', 16), e.created "
+            "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid "
+            "WHERE entries_fts MATCH ? ORDER BY rank LIMIT ?"
+        )
+
+        try:
+            return self.db.execute(sql, (query, limit)).fetchall()
+        except sqlite3.OperationalError:
+            # Not valid FTS syntax, search for the words literally instead
+            quoted = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+            return self.db.execute(sql, (quoted, limit)).fetchall() if quoted else []
+
+# Helper function to display search results
+def display_search_results(index, query):
+    start = time.perf_counter()
+    results = index.search(query)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if not results:
+        console.print(f"[yellow]No matches for '{escape(query)}'.[/yellow]")
+        return
+
+    table = Table(title=f"Search: {escape(query)} ({len(results)} results in {elapsed:.1f} ms)")
+    table.add_column("Conversation", style="cyan", no_wrap=True)
+    table.add_column("Message", style="green", justify="right")
+    table.add_column("Role", style="magenta")
+    table.add_column("Match")
+
+    for conversation_id, message_index, role, snippet, created in results:
+        snippet = escape(snippet.replace("\n", " "))
+        snippet = snippet.replace("\x02", "[bold yellow]").replace("\x03", "[/bold yellow]")
+        table.add_row(conversation_id, str(message_index), role, snippet)
+
+    console.print(table)
+    console.print("[dim]Type '/load <conversation>' to open a conversation.[/dim]")
+
+# Write the conversation, with the reasoning behind each answer, as Markdown (.md)
+# or JSON lines. Messages are read one at a time, so spilled turns are not all
+# loaded into memory at once.
+def export_conversation(messages, path):
+    markdown = path.lower().endswith(".md")
+
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(len(messages)):
+            message = messages[i]
+            reasoning = messages.reasoning(i) if isinstance(messages, SessionStore) else None
+
+            if not markdown:
+                record = dict(message, reasoning_content=reasoning) if reasoning else message
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                continue
+
+            f.write(f"## {message['role'].capitalize()} (Message {i})\n\n")
+            if reasoning:
+                f.write("<details><summary>Chain of Thought</summary>\n\n" + reasoning + "\n\n</details>\n\n")
+            f.write(message["content"] + "\n\n")
+
+# Open a conversation from its local journal
+def load_local_conversation(journal_dir, conversation_id):
+    journal = ConversationJournal(journal_dir, conversation_id)
+    with open(journal.path, encoding="utf-8") as f:
+        messages = ConversationJournal.replay(f)
+
+    return journal, messages
+
+# Files attached to the conversation with the 'attach' command. Attached files are
+# queued and sent with the next message, split into chunks when they are larger
+# than the attachment budget; chunks that do not fit go with the messages after it.
+# Files are identified by content hash, so a file that is still in the context
+# sent to the API is not added again, and hashes and token counts are cached by path,
+# size and modification time, so re-attaching unchanged files does not read them.
+class Attachments:
+    # Larger files are memory-mapped instead of read into a buffer first
+    MMAP_THRESHOLD = 1024 * 1024
+    # Bytes inspected for NUL characters to tell binary files apart
+    SNIFF_BYTES = 8192
+    SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", ".mypy_cache"}
+
+    def __init__(self):
+        self.file_info = {}
+        # Content hash -> index of the message that carries the file, None while queued
+        self.sent_hashes = {}
+        self.pending = []
+
+    # Start over for another conversation
+    def reset(self):
+        self.sent_hashes.clear()
+        self.pending.clear()
+
+    # Paths matching a path, directory or glob pattern; directories are walked recursively
+    def expand(self, pattern):
+        import glob
+
+        paths = []
+        for match in sorted(glob.glob(os.path.expanduser(pattern), recursive=True)):
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    dirs[:] = sorted(d for d in dirs if d not in self.SKIP_DIRS and not d.startswith("."))
+                    paths.extend(os.path.join(root, name) for name in sorted(files))
+            else:
+                paths.append(match)
+
+        return paths
+
+    # Read a text file; returns its content hash and text, or None for binary files
+    def read(self, path, size):
+        with open(path, "rb") as f:
+            if size >= self.MMAP_THRESHOLD:
+                import mmap
+
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if b"\0" in data[:self.SNIFF_BYTES]:
+                        return None
+                    return hashlib.sha1(data).hexdigest(), str(data, "utf-8")
+
+            data = f.read()
+            if b"\0" in data[:self.SNIFF_BYTES]:
+                return None
+            return hashlib.sha1(data).hexdigest(), data.decode("utf-8")
+
+    # Queue the files matching pattern. Returns the number of files and tokens
+    # queued and the skipped paths with the reason.
+    def add(self, pattern, chunk_tokens):
+        added = tokens = 0
+        skipped = []
+
+        for path in self.expand(pattern):
+            try:
+                stat = os.stat(path)
+                key = (stat.st_size, stat.st_mtime_ns)
+                info = self.file_info.get(path)
+
+                # Unchanged since it was last read, and already in the conversation
+                if info and info[0] == key and info[1] in self.sent_hashes:
+                    skipped.append((path, "already attached"))
+                    continue
+
+                result = self.read(path, stat.st_size)
+                if result is None:
+                    skipped.append((path, "binary"))
+                    continue
+                content_hash, text = result
+                if content_hash in self.sent_hashes:
+                    skipped.append((path, "already attached"))
+                    continue
+            except UnicodeDecodeError:
+                skipped.append((path, "not UTF-8 text"))
+                continue
+            except OSError as e:
+                skipped.append((path, e.strerror or str(e)))
+                continue
+
+            file_tokens = info[2] if info and info[1] == content_hash else estimate_tokens(text)
+            self.file_info[path] = (key, content_hash, file_tokens)
+            self.sent_hashes[content_hash] = None
+            self.pending.extend(chunk + (content_hash,) for chunk in self.chunk(path, text, file_tokens, chunk_tokens))
+            added += 1
+            tokens += file_tokens
+
+        return added, tokens, skipped
+
+    # Split a file into fenced chunks of about chunk_tokens each, at line boundaries
+    @staticmethod
+    def chunk(path, text, tokens, chunk_tokens):
+        count = max(-(-tokens // max(chunk_tokens, 1)), 1)
+        target = len(text) // count + 1
+        parts = []
+        start = 0
+        while start < len(text):
+            end = text.find("\n", start + target)
+            end = len(text) if end == -1 else end + 1
+            parts.append(text[start:end])
+            start = end
+
+        fence = "```"
+        while fence in text:
+            fence += "`"
+        language = os.path.splitext(path)[1].lstrip(".")
+
+        chunks = []
+        for i, part in enumerate(parts or [""], 1):
+            label = f"{path} (part {i} of {len(parts)})" if len(parts) > 1 else path
+            content = f"Attached file {label}:\n{fence}{language}\n{part.rstrip()}\n{fence}\n\n"
+            chunks.append((label, content, estimate_tokens(content)))
+
+        return chunks
+
+    # Take queued chunks up to budget tokens, always at least one, to be sent in the
+    # message at `index`; returns the chunks
+    def take(self, budget, index):
+        taken = []
+        used = 0
+        while self.pending and (not taken or used + self.pending[0][2] <= budget):
+            taken.append(self.pending.pop(0))
+            used += taken[-1][2]
+            self.sent_hashes[taken[-1][3]] = index
+
+        return taken
+
+    # Put chunks back at the front of the queue, e.g. when sending them failed
+    def restore(self, chunks):
+        self.pending[:0] = chunks
+        for chunk in chunks:
+            self.sent_hashes[chunk[3]] = None
+
+    # Forget files whose messages were trimmed from the context, so they can be
+    # attached again; first_sent is the oldest message index still sent
+    def expire(self, first_sent):
+        for content_hash, index in list(self.sent_hashes.items()):
+            if index is not None and index < first_sent:
+                del self.sent_hashes[content_hash]
+
+# Answer a single prompt without any interactive screens; returns the exit code
+def run_one_shot(args, params, client=None, history=None):
+    # A session's earlier turns, when the daemon keeps them
+    messages = list(history or [{"role": "system", "content": params["system_message"]}])
+    messages.append({"role": "user", "content": args.one_shot})
+    cache = open_cache(args)
+
+    # Keep the request within the context budget; turns trimmed here are dropped
+    # from the session too, so it does not grow without bound
+    messages = fit_context(messages, params["context_budget"])[0]
+
+    try:
+        if args.compare:
+            columns = compare_variants(client or create_client(params), params, messages, args.compare,
+                                       Telemetry(args.metrics_file) if args.metrics_file else None)
+            return 1 if any(column.error for column in columns) else 0
+
+        cached = cache.get(build_request(params, messages)) if cache else None
+
+        if cached:
+            reasoning_content, final_answer = cached
+            display_turn(reasoning_content, final_answer)
+        else:
+            client = client or create_client(params)
+            reasoning_content, final_answer, metrics = request_turn(
+                client, params, messages, RequestPolicy(params), stream=not args.no_stream
+            )
+
+            if args.metrics_file:
+                Telemetry(args.metrics_file).record(metrics)
+            if cache:
+                cache.put(build_request(params, messages), reasoning_content, final_answer)
+    except Exception as e:
+        console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
+        return 1
+
+    if history is not None:
+        history[:] = messages + [{"role": "assistant", "content": final_answer}]
+    return 0
+
+# Default location of the daemon's socket
+def default_socket_path():
+    directory = os.getenv("XDG_RUNTIME_DIR") or os.path.expanduser("~/.cache/deepseek-cli")
+    return os.path.join(directory, "deepseek-cli.sock")
+
+# Console that forwards to the console bound to the calling thread, so concurrent
+# daemon requests each render to their own client. Live displays refresh from a
+# thread of their own, which is mapped back to the console that started the display.
+class ThreadConsole:
+    def __init__(self, default):
+        import weakref
+
+        self.default = default
+        self.local = threading.local()
+        self.live_consoles = weakref.WeakKeyDictionary()
+
+    def bind(self, target):
+        self.local.console = target
+
+    def current(self):
+        target = getattr(self.local, "console", None)
+        if target is None:
+            live = getattr(threading.current_thread(), "live", None)
+            target = self.live_consoles.get(live) if live is not None else None
+        return target or self.default
+
+    def set_live(self, live):
+        target = self.current()
+        self.live_consoles[live] = target
+        return target.set_live(live)
+
+    def __enter__(self):
+        return self.current().__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.current().__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+# Background process that answers one-shot prompts over a Unix domain socket. It
+# keeps openai imported, API clients with warm connection pools, and the recent
+# turns of named sessions in memory, so a one-shot run only pays for starting a
+# thin client. Each connection is served on its own thread.
+#
+# Protocol: the client sends one JSON line with its parsed arguments and terminal
+# size; the daemon streams back the rendered output, then a NUL byte and a JSON
+# status line with the exit code.
+class Daemon:
+    # Named sessions kept in memory, least recently used first out
+    MAX_SESSIONS = 32
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.warmers = {}
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    # API client sharing a warm connection pool per set of connection settings
+    def client(self, params):
+        key = tuple(params[key] for key in CONNECTION_PARAMS)
+        with self.lock:
+            warmer = self.warmers.get(key)
+            if warmer is None:
+                warmer = self.warmers[key] = ConnectionWarmer(params).start()
+        return warmer, warmer.client(params)
+
+    # A session's lock and history. Prompts of the same session are answered one at
+    # a time under the lock, so concurrent prompts each see the other's turn.
+    def session(self, name):
+        with self.lock:
+            session = self.sessions.pop(name, None) or (threading.Lock(), [])
+            self.sessions[name] = session
+            while len(self.sessions) > self.MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+        return session
+
+    def handle(self, connection):
+        request = json.loads(connection.rfile.readline() or b"{}")
+        args = argparse.Namespace(**request["args"])
+        params = {name: getattr(args, name) for name in DEFAULT_PARAMS}
+
+        output = Console(
+            file=io.TextIOWrapper(connection.wfile, encoding="utf-8", write_through=True),
+            width=request.get("width"), height=request.get("height"),
+            force_terminal=request.get("terminal", False), color_system=request.get("color_system")
+        )
+        console.bind(output)
+        try:
+            warmer, client = self.client(params)
+            warmer.begin()
+            try:
+                if args.session:
+                    lock, history = self.session(args.session)
+                    with lock:
+                        code = run_one_shot(args, params, client, history)
+                else:
+                    code = run_one_shot(args, params, client)
+            finally:
+                warmer.end()
+        finally:
+            console.bind(None)
+
+        connection.wfile.write(b"\0" + json.dumps({"exit": code}).encode("utf-8") + b"\n")
+
+    def serve(self):
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    daemon.handle(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client went away, e.g. on Ctrl-C
+                    pass
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            if daemon_running(self.socket_path):
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+
+        # The socket carries API keys, so only its owner may connect
+        previous_umask = os.umask(0o177)
+        try:
+            server = Server(self.socket_path, Handler)
+        finally:
+            os.umask(previous_umask)
+
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(self.socket_path)
+
+def daemon_running(socket_path):
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+# Start the daemon in the foreground; importing openai up front is the point
+def run_daemon(args):
+    global console
+
+    import openai  # noqa: F401
+
+    console = ThreadConsole(console)
+    daemon = Daemon(args.socket)
+    console.print(f"[bold blue]DeepSeek CLI daemon[/bold blue] listening on {args.socket} (Ctrl-C to stop)")
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
+        sys.exit(1)
+
+# Forward a one-shot run to the daemon and copy its output to the terminal.
+# Returns the exit code, or None when no daemon is listening.
+def forward_to_daemon(args):
+    import socket
+
+    if not os.path.exists(args.socket):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(args.socket)
+    except OSError:
+        sock.close()
+        return None
+
+    request = {
+        "args": vars(args),
+        "width": console.width,
+        "height": console.height,
+        "terminal": console.is_terminal,
+        "color_system": console.color_system,
+    }
+    output = sys.stdout.buffer
+    status = None
+    with sock:
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            if status is None:
+                head, separator, rest = data.partition(b"\0")
+                output.write(head)
+                output.flush()
+                if separator:
+                    status = rest
+            else:
+                status += data
+
+    try:
+        return json.loads(status)["exit"]
+    except (TypeError, ValueError):
+        # The daemon went away mid-answer
+        return 1
+
+# Lets the user type the next prompts while an answer is still arriving. While
+# active, the terminal is switched to unbuffered, no-echo input and a thread
+# collects keystrokes; the line being typed is drawn by the live view it is passed
+# to as a footer, and each line finished with Enter is queued. Ctrl-C still
+# interrupts the request. Inactive when stdin is not a terminal or on platforms
+# without termios.
+class TypeAhead:
+    def __init__(self):
+        self.queued = []
+        self.buffer = ""
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.saved_mode = None
+
+    def __enter__(self):
+        try:
+            import termios
+
+            fd = sys.stdin.fileno()
+            if not os.isatty(fd):
+                return self
+            self.saved_mode = termios.tcgetattr(fd)
+        except (ImportError, OSError, ValueError):
+            return self
+
+        mode = termios.tcgetattr(fd)
+        mode[3] &= ~(termios.ICANON | termios.ECHO)
+        mode[6][termios.VMIN] = 1
+        mode[6][termios.VTIME] = 0
+        termios.tcsetattr(fd, termios.TCSANOW, mode)
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._read, args=(fd,), daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.thread is None:
+            return
+
+        import termios
+
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, self.saved_mode)
+
+    def _read(self, fd):
+        import select
+
+        while not self.stopped.is_set():
+            if not select.select([fd], [], [], 0.05)[0]:
+                continue
+            text = os.read(fd, 1024).decode("utf-8", errors="ignore")
+            with self.lock:
+                for char in text:
+                    if char in "\r\n":
+                        if self.buffer.strip():
+                            self.queued.append(self.buffer.strip())
+                        self.buffer = ""
+                    elif char in "\x7f\b":
+                        self.buffer = self.buffer[:-1]
+                    elif char == "\x15":
+                        # Ctrl-U clears the line
+                        self.buffer = ""
+                    elif char.isprintable():
+                        self.buffer += char
+
+    # The next queued prompt, or None
+    def next(self):
+        with self.lock:
+            return self.queued.pop(0) if self.queued else None
+
+    # Text typed without pressing Enter, removed from the buffer
+    def take_partial(self):
+        with self.lock:
+            partial, self.buffer = self.buffer, ""
+            return partial
+
+    def __rich_console__(self, console, options):
+        if self.thread is None:
+            return
+
+        with self.lock:
+            queued = len(self.queued)
+            buffer = self.buffer
+
+        status = f" [dim]({queued} queued)[/dim]" if queued else ""
+        yield Text.from_markup(f"[bold cyan]Next{status}:[/bold cyan] ") + Text(buffer[-(options.max_width - 20):] + "▌")
+
+# Ask for the next message with text typed ahead but not sent already filled in.
+# Without readline (Windows), the text is offered as the default instead.
+def ask_with_partial(partial):
+    if not partial:
+        return Prompt.ask("")
+
+    try:
+        import readline
+    except ImportError:
+        return Prompt.ask("", default=partial)
+
+    readline.set_startup_hook(lambda: readline.insert_text(partial))
+    try:
+        return Prompt.ask("")
+    finally:
+        readline.set_startup_hook(None)
+
+# Arguments of a chat command. Commands with arguments are typed as '/name ARGS',
+# so prose such as "export the table as CSV" still goes to the model; the bare
+# word (or '/name') runs the command without arguments. Returns None when the
+# input is not the command.
+def command_args(user_input, name):
+    text = user_input.strip()
+    if text.lower() in (name, "/" + name):
+        return ""
+    if text.lower().startswith("/" + name + " "):
+        return text[len(name) + 2:].strip()
+    return None
+
+# Main function
+def main():
+    args = setup_args()
+
+    # Batch mode runs without any interactive screens
+    if args.batch:
+        run_batch(args, vars(args))
+        return
+
+    # Search saved conversations and exit
+    if args.search:
+        display_search_results(SearchIndex(os.path.join(args.journal_dir, "index.db")), args.search)
+        return
+
+    # Serve one-shot prompts from a warm background process
+    if args.daemon:
+        run_daemon(args)
+        return
+
+    # Answer a single prompt and exit, through the daemon when one is running
+    if args.one_shot:
+        code = None if args.no_daemon else forward_to_daemon(args)
+        if code is None:
+            if args.session:
+                console.print("[dim]No daemon running; --session history is only kept by the daemon.[/dim]")
+            code = run_one_shot(args, vars(args))
+        sys.exit(code)
+
+    # Connect to the API while the user is still configuring and typing
+    warmer = ConnectionWarmer(vars(args)).start()
+    
+    # Reopen the warm connection when the connection settings were edited since it
+    # was opened; the pool, its timeouts and the host are fixed when it is created
+    def refresh_connection():
+        nonlocal warmer, client
+        if not warmer.matches(params):
+            warmer.stop()
+            warmer = ConnectionWarmer(params).start()
+            client = None
+
+    # Run interactive configuration if not disabled
+    if not args.no_interactive:
+        params = interactive_config(args)
+    else:
+        params = vars(args)
+    
+    # The OpenAI client is created when the first request is sent
+    client = None
+    refresh_connection()
+    cache = open_cache(args)
+
+    # Rendered history messages, reused across 'history' views
+    render_cache = RenderCache()
+
+    # Per-request performance metrics for the 'stats' command and exporters
+    telemetry = Telemetry(args.metrics_file)
+    if args.metrics_port:
+        telemetry.serve(args.metrics_port)
+
+    # Every completed turn is journaled locally; S3 storage is opened on first save/load
+    journal = ConversationJournal(args.journal_dir, new_conversation_id())
+
+    # Initialize the conversation with the system message. Older turns and their
+    # reasoning are spilled to disk, so memory use does not grow with the session.
+    messages = SessionStore(args.journal_dir, journal.conversation_id, args.hot_messages)
+    messages.append({"role": "system", "content": params["system_message"]})
+    journal.append(0, messages[0])
+    prefix = StablePrefix()
+    attachments = Attachments()
+    storage = None
+    index = SearchIndex(os.path.join(args.journal_dir, "index.db"))
+    
+    # Journal the turn that was just appended to messages and make it searchable
+    def record_turn(reasoning_content):
+        journal.append(len(messages) - 2, messages[-2])
+        journal.append(len(messages) - 1, messages[-1], reasoning_content)
+        index.add(journal.conversation_id, [
+            (len(messages) - 2, "user", messages[-2]["content"]),
+            (len(messages) - 1, "assistant", messages[-1]["content"]),
+            (len(messages) - 1, "reasoning", reasoning_content if args.index_reasoning else None),
+        ])
+
+    # Change the system message; see the 'system' command
+    def set_system_message(new_system):
+        params["system_message"] = new_system
+        if params["stable_prefix"] and len(messages) > 1:
+            # Rewriting messages[0] would invalidate the whole cached prefix, so
+            # the change is sent as a new instruction after the history instead
+            messages.append({"role": "system", "content": new_system})
+            journal.append(len(messages) - 1, messages[-1])
+            console.print("[green]System message added as a new instruction.[/green]")
+        else:
+            messages.set_content(0, new_system)
+            journal.append(0, messages[0])
+            console.print("[green]System message updated successfully![/green]")
+
+    # The profile the session started with or last switched to, and the parameters
+    # every switch starts from: the startup ones, as configured, without a profile
+    active_profile = args.profile
+    base_params = args.base_params if args.profile else {name: params[name] for name in DEFAULT_PARAMS}
+
+    # Display welcome message and instructions
+    console.print(Panel.fit(
+        f"[bold blue]DeepSeek Reasoner CLI[/bold blue] - [yellow]Model: {params['model']}[/yellow]"
+        f"{f' - [cyan]Profile: {escape(active_profile)}[/cyan]' if active_profile else ''}",
+        subtitle="Type 'exit' to end the conversation, 'params' to edit parameters, 'system' to edit system message, 'history' to view conversation",
+        border_style="blue"
+    ))
+    
+    # Prompts typed while an answer is arriving are queued here
+    type_ahead = TypeAhead()
+
+    # Main conversation loop
+    while True:
+        # Report failed background uploads
+        while storage and storage.errors:
+            console.print(f"[bold red]Error:[/bold red] {storage.errors.pop(0)}")
+
+        # Send prompts queued during the previous answer before asking for more
+        user_input = type_ahead.next()
+        if user_input is not None:
+            console.print(f"\n[bold cyan]Sending queued message:[/bold cyan] {escape(user_input)}")
+        else:
+            # Display parameter edit prompt and message input in different colors
+            console.print("\n[bold cyan]Enter your message[/bold cyan] ([italic]Type 'params' to edit parameters, 'system' to edit system message, 'history' to view conversation, or 'exit' to quit[/italic]):")
+            try:
+                user_input = ask_with_partial(type_ahead.take_partial())
+            except KeyboardInterrupt:
+                console.print("\n[yellow]Type 'exit' or press Ctrl-D to quit.[/yellow]")
+                continue
+            except EOFError:
+                user_input = "exit"
+        
+        # Check for special commands
+        if user_input.lower() == 'exit':
+            warmer.stop()
+            messages.close()
+            if storage:
+                with console.status("[bold green]Finishing uploads...[/bold green]", spinner="dots"):
+                    storage.wait()
+            console.print("[yellow]Conversation ended.[/yellow]")
+            break
+        elif user_input.lower() == 'params':
+            params = edit_parameters(params)
+            refresh_connection()
+            continue
+        elif user_input.lower() == 'system':
+            current_system = params["system_message"]
+            console.print(f"\n[bold magenta]Current system message:[/bold magenta]\n{current_system}")
+            new_system = Prompt.ask("\n[bold magenta]Enter new system message[/bold magenta]", default=current_system)
+            set_system_message(new_system)
+            continue
+        elif command_args(user_input, 'profile') is not None:
+            name = command_args(user_input, 'profile')
+            try:
+                profiles = load_profiles(args.profiles_file)
+            except (OSError, ValueError) as e:
+                console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
+                continue
+
+            if not name:
+                display_profiles(profiles, active_profile)
+            elif name not in profiles:
+                console.print(f"[yellow]Unknown profile '{escape(name)}'. Available: {', '.join(profiles)}[/yellow]")
+            else:
+                # Profiles were validated when they were loaded, so they apply as they
+                # are; each switch starts from the base, not from the previous profile
+                profile = profiles[name]
+                new_system = profile.get("system_message", base_params["system_message"])
+                params = {**params, **base_params, **profile, "system_message": params["system_message"]}
+                active_profile = name
+                if new_system != params["system_message"]:
+                    set_system_message(new_system)
+                refresh_connection()
+                settings = ', '.join(f'{key}={value}' for key, value in profile.items() if key != "system_message")
+                console.print(f"[green]Switched to profile '{escape(name)}'{': ' + settings if settings else ''}[/green]")
+            continue
+        elif user_input.lower() == 'history':
+            display_history(messages, render_cache)
+            continue
+        elif user_input.lower() in ('cache stats', 'cache clear'):
+            if cache is None:
+                console.print("[yellow]The response cache is disabled. Start with --cache to enable it.[/yellow]")
+            elif user_input.lower() == 'cache stats':
+                display_cache_stats(cache)
+            else:
+                console.print(f"[green]Removed {cache.clear()} cached responses.[/green]")
+            continue
+        elif user_input.lower() == 'save':
+            storage = storage or open_storage()
+            if storage:
+                storage.save(journal)
+                console.print(f"[green]Saving conversation {journal.conversation_id} in the background.[/green]")
+            continue
+        elif command_args(user_input, 'load') is not None:
+            conversation_id = command_args(user_input, 'load')
+
+            # Conversations with a local journal, e.g. search hits, are opened from it;
+            # S3 is only needed for conversations this machine does not have
+            if conversation_id:
+                if os.path.exists(ConversationJournal(args.journal_dir, conversation_id).path):
+                    journal, loaded = load_local_conversation(args.journal_dir, conversation_id)
+                    messages.close()
+                    messages = SessionStore.from_messages(args.journal_dir, conversation_id, loaded, args.hot_messages)
+                    params["system_message"] = current_system_message(messages)
+                    prefix.reset()
+                    attachments.reset()
+                    console.print(f"[green]Loaded conversation {conversation_id} ({len(messages) - 1} messages).[/green]")
+                    continue
+
+            storage = storage or open_storage()
+            if not storage:
+                continue
+            try:
+                conversation_id = conversation_id or choose_conversation(storage)
+                if conversation_id:
+                    with console.status("[bold green]Loading conversation...[/bold green]", spinner="dots"):
+                        journal, loaded = storage.load(conversation_id, args.journal_dir)
+                    index.add_messages(conversation_id, loaded)
+                    messages.close()
+                    messages = SessionStore.from_messages(args.journal_dir, conversation_id, loaded, args.hot_messages)
+                    params["system_message"] = current_system_message(messages)
+                    prefix.reset()
+                    attachments.reset()
+                    console.print(f"[green]Loaded conversation {conversation_id} ({len(messages) - 1} messages).[/green]")
+            except Exception as e:
+                console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
+            continue
+        elif user_input.lower() == 'stats':
+            display_stats(telemetry)
+            continue
+        elif command_args(user_input, 'export') is not None:
+            path = os.path.expanduser(command_args(user_input, 'export'))
+            if not path:
+                console.print("[yellow]Usage: /export PATH (.md for Markdown, anything else for JSON lines)[/yellow]")
+                continue
+            try:
+                export_conversation(messages, path)
+                console.print(f"[green]Exported {len(messages)} messages to {path}[/green]")
+            except OSError as e:
+                console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
+            continue
+        elif command_args(user_input, 'search') is not None:
+            query = command_args(user_input, 'search')
+            if query:
+                display_search_results(index, query)
+            else:
+                console.print("[yellow]Usage: /search QUERY[/yellow]")
+            continue
+        elif command_args(user_input, 'attach') is not None:
+            pattern = command_args(user_input, 'attach')
+            if pattern:
+                started = time.perf_counter()
+                added, tokens, skipped = attachments.add(pattern, params["context_budget"] // 2)
+                elapsed = time.perf_counter() - started
+                if added:
+                    console.print(
+                        f"[green]Attached {added} files (~{tokens} tokens) in {elapsed * 1000:.0f} ms; "
+                        f"they are sent with your next message.[/green]"
+                    )
+                reasons = {}
+                for path, reason in skipped:
+                    reasons.setdefault(reason, []).append(path)
+                for reason, paths in reasons.items():
+                    shown = ", ".join(paths[:5]) + (f" and {len(paths) - 5} more" if len(paths) > 5 else "")
+                    console.print(f"[yellow]Skipped ({reason}): {shown}[/yellow]")
+                if not added and not skipped:
+                    console.print(f"[yellow]No files match {pattern}[/yellow]")
+            elif attachments.pending:
+                for label, _, tokens, _ in attachments.pending:
+                    console.print(f"  {label} (~{tokens} tokens)")
+            else:
+                console.print("[yellow]Usage: /attach <path|directory|glob>[/yellow]")
+            continue
+        elif command_args(user_input, 'compare') is not None:
+            specs = command_args(user_input, 'compare').split() or args.compare
+            if not specs:
+                console.print("[yellow]Usage: /compare VARIANT VARIANT ... (e.g. /compare deepseek-chat temperature=1.2)[/yellow]")
+                continue
+
+            prompt = Prompt.ask("[bold cyan]Prompt to compare[/bold cyan]")
+            messages.append({"role": "user", "content": prompt})
+            context, _, _, _ = fit_context(messages, params["context_budget"])
+            messages.pop()
+            try:
+                client = client or warmer.client(params)
+                warmer.begin()
+                try:
+                    columns = compare_variants(client, params, context, specs, telemetry)
+                finally:
+                    warmer.end()
+            except KeyboardInterrupt:
+                console.print("\n[yellow]Comparison cancelled.[/yellow]")
+                continue
+            except Exception as e:
+                console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
+                continue
+
+            # Optionally continue the conversation with one of the answers
+            choices = [str(i) for i, column in enumerate(columns, 1) if not column.error]
+            if choices:
+                choice = Prompt.ask(
+                    f"Keep which answer in the conversation? ({', '.join(choices)}, or Enter to discard)",
+                    choices=choices + [""], default="", show_choices=False, show_default=False
+                )
+                if choice:
+                    column = columns[int(choice) - 1]
+                    reasoning_content = "".join(column.reasoning_parts) or None
+                    messages.append({"role": "user", "content": prompt})
+                    messages.append({"role": "assistant", "content": "".join(column.answer_parts)}, reasoning_content)
+                    try:
+                        record_turn(reasoning_content)
+                    except Exception as e:
+                        console.print(f"\n[bold red]Error:[/bold red] Could not journal the turn: {str(e)}")
+            continue
+        
+        # Attached files go in front of the message, up to half the context budget
+        attached = attachments.take(params["context_budget"] // 2, len(messages))
+        if attached:
+            console.print(f"[dim]Sending {len(attached)} attachments"
+                          f"{f', {len(attachments.pending)} more with the next message' if attachments.pending else ''}[/dim]")
+
+        # Add user message to conversation history
+        messages.append({"role": "user", "content": "".join(content for _, content, _, _ in attached) + user_input})
+        
+        # Keep the request within the context budget
+        if params["stable_prefix"]:
+            context, sent_tokens, trimmed_tokens, trimmed_count, reused_tokens = prefix.fit(
+                messages, params["context_budget"]
+            )
+            console.print(
+                f"[dim]Context: ~{sent_tokens} tokens sent (~{reused_tokens} unchanged from the previous request), "
+                f"~{trimmed_tokens} trimmed ({trimmed_count} older messages)[/dim]"
+            )
+        else:
+            context, sent_tokens, trimmed_tokens, trimmed_count = fit_context(messages, params["context_budget"])
+            console.print(
+                f"[dim]Context: ~{sent_tokens} tokens sent, ~{trimmed_tokens} trimmed "
+                f"({trimmed_count} older messages)[/dim]"
+            )
+
+        # Files in trimmed messages are no longer seen by the model and may be attached again
+        attachments.expire(first_sent_index(messages, trimmed_count))
+
+        try:
+            # Serve identical requests from the cache without touching the network
+            cached = cache.get(build_request(params, context)) if cache else None
+
+            if cached:
+                console.print("[dim]Served from response cache[/dim]")
+                reasoning_content, final_answer = cached
+                display_turn(reasoning_content, final_answer)
+            else:
+                # Send the conversation to the API with customized parameters
+                # The next prompts can be typed meanwhile; Ctrl-C cancels the request
+                client = client or warmer.client(params)
+                warmer.begin()
+                try:
+                    with type_ahead:
+                        reasoning_content, final_answer, metrics = request_turn(
+                            client, params, context, RequestPolicy(params, telemetry),
+                            stream=not args.no_stream, footer=type_ahead
+                        )
+                finally:
+                    warmer.end()
+
+                display_turn_metrics(telemetry.record(metrics))
+
+                if cache:
+                    cache.put(build_request(params, context), reasoning_content, final_answer)
+
+        except KeyboardInterrupt:
+            console.print("\n[yellow]Request cancelled.[/yellow]")
+            # The conversation continues as if the message had not been sent
+            messages.pop()
+            attachments.restore(attached)
+        except Exception as e:
+            console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
+            # Remove the last user message since we couldn't get a response
+            messages.pop()
+            attachments.restore(attached)
+        else:
+            # Only the final answer is sent back to the API; the reasoning is kept for history and export
+            messages.append({"role": "assistant", "content": final_answer}, reasoning_content)
+
+            # The answer stays in the conversation even if journaling it fails
+            try:
+                record_turn(reasoning_content)
+            except Exception as e:
+                console.print(f"\n[bold red]Error:[/bold red] Could not journal the turn: {str(e)}")
 
 if __name__ == "__main__":
     main()